@@ -3,68 +3,120 @@ FastAPI Backend for Voice Agent
 Provides REST API for frontend (users, mentors, admin, appointments)
 """
 import os
+import re
+import asyncio
 import jwt
+import orjson
+from jwt.algorithms import HMACAlgorithm
+import time
 import bcrypt
+import hashlib
+import secrets
 import logging
-from datetime import datetime, timedelta, date, time
-from typing import Optional, List
-from functools import wraps
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Optional
 
+from cachetools import TTLCache
 from fastapi import FastAPI, HTTPException, Depends, Header, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field
-from dotenv import load_dotenv
-from pathlib import Path
 
-# Load .env from project root (parent of backend directory)
-env_path = Path(__file__).parent.parent / ".env"
-if env_path.exists():
-    load_dotenv(env_path)
-else:
-    # Also try backend/.env
-    load_dotenv(Path(__file__).parent / ".env")
-    # And current directory
-    load_dotenv()
+import settings
+from db import Database, close_client, next_cursor, request_now
 
-from db import Database
+try:
+    from livekit import api as livekit_api
+except ImportError:
+    livekit_api = None
 
 logger = logging.getLogger(__name__)
 
 # ==================== APP SETUP ====================
 
+db = Database.get()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await db.connect()
+    yield
+    await close_client()
+
 app = FastAPI(
     title="Voice Agent API",
     description="API for appointment booking voice agent",
-    version="1.0.0"
+    version="1.0.0",
+    # orjson serializes the plain dict/list payloads returned below several
+    # times faster than the stdlib encoder
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 # CORS configuration - use ALLOWED_ORIGINS env var in production
-allowed_origins_str = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000")
+allowed_origins_str = settings.ALLOWED_ORIGINS
 allowed_origins = [origin.strip() for origin in allowed_origins_str.split(",") if origin.strip()]
 # In development, allow localhost
-if os.getenv("ENVIRONMENT") != "production":
+if settings.ENVIRONMENT != "production":
     allowed_origins.extend(["http://localhost:3000", "http://127.0.0.1:3000"])
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # Explicit lists keep the per-request match cheap; max_age lets browsers
+    # cache the preflight for a day instead of repeating it per endpoint
+    allow_methods=["GET", "POST", "PUT", "DELETE"],
+    allow_headers=["Authorization", "Content-Type"],
+    expose_headers=["X-Next-Cursor"],
+    max_age=86400,
 )
 
-db = Database()
+
+
+class RequestNowMiddleware:
+    """Pin one UTC timestamp per request so every DB write shares it."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = request_now.set(datetime.now(timezone.utc).isoformat())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_now.reset(token)
+
+
+app.add_middleware(RequestNowMiddleware)
+
 security = HTTPBearer(auto_error=False)
 
 # JWT Secret - fail in production if not set
-JWT_SECRET = os.getenv("JWT_SECRET")
+JWT_SECRET = settings.JWT_SECRET
 if not JWT_SECRET or JWT_SECRET == "your-secret-key-change-in-production":
-    if os.getenv("ENVIRONMENT") == "production" or os.getenv("RAILWAY_ENVIRONMENT"):
+    if settings.ENVIRONMENT == "production" or settings.RAILWAY_ENVIRONMENT:
         raise ValueError("JWT_SECRET must be set in production! Set it in Railway environment variables.")
     JWT_SECRET = "dev-secret-key-only-for-local-development"  # Only for local dev
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRY_HOURS = 24
+JWT_EXPIRY_SECONDS = JWT_EXPIRY_HOURS * 3600
+# Validated/encoded once so encode and decode don't redo it per call
+_JWT_KEY = HMACAlgorithm(HMACAlgorithm.SHA256).prepare_key(JWT_SECRET)
+_JWT_HEADERS = {"alg": JWT_ALGORITHM, "typ": "JWT"}
+_JWT_DECODE_OPTIONS = {"verify_aud": False, "require": ["exp"]}
+
+# Verified token payloads keyed by SHA-256 of the raw token. Entries never
+# outlive the token's own `exp` claim (checked on every hit). TTLCache isn't
+# thread-safe, so it is only touched from the event loop (the token
+# dependencies below are async, not threadpool-run).
+_jwt_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+
+_NON_DIGIT = re.compile(r"\D")
 
 # ==================== PYDANTIC MODELS ====================
 
@@ -121,29 +173,45 @@ def create_token(user_id: str, user_type: str, extra_data: dict = None) -> str:
     payload = {
         "sub": user_id,
         "type": user_type,
-        "exp": datetime.utcnow() + timedelta(hours=JWT_EXPIRY_HOURS),
+        "exp": int(time.time()) + JWT_EXPIRY_SECONDS,
         **(extra_data or {})
     }
-    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    return jwt.encode(payload, _JWT_KEY, algorithm=JWT_ALGORITHM, headers=_JWT_HEADERS)
+
+def _decode_token(raw_token: str) -> dict:
+    """Decode a JWT, reusing the cached payload for recently verified tokens.
+
+    Raises the usual PyJWT errors; failures are never cached.
+    """
+    key = hashlib.sha256(raw_token.encode()).hexdigest()
+    payload = _jwt_cache.get(key)
+    if payload is not None:
+        if payload["exp"] > time.time():
+            return payload
+        _jwt_cache.pop(key, None)
+    payload = jwt.decode(
+        raw_token, _JWT_KEY, algorithms=[JWT_ALGORITHM], options=_JWT_DECODE_OPTIONS
+    )
+    if payload["exp"] > time.time():
+        _jwt_cache[key] = payload
+    return payload
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     if not credentials:
         raise HTTPException(status_code=401, detail="Not authenticated")
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
+        return _decode_token(credentials.credentials)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-def verify_token_optional(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict | None:
+async def verify_token_optional(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict | None:
     """Optional token verification - returns None if no token provided."""
     if not credentials:
         return None
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
+        return _decode_token(credentials.credentials)
     except:
         return None
 
@@ -162,29 +230,42 @@ def require_user(token: dict = Depends(verify_token)) -> dict:
         raise HTTPException(status_code=403, detail="User access required")
     return token
 
+# bcrypt is deliberately slow - call these via run_in_threadpool from async
+# handlers so the event loop keeps serving other requests.
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)).decode()
 
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode(), hashed.encode())
 
+def _normalize_phone(raw: str) -> str:
+    """Strip formatting and add a country code (+1 for bare 10-digit numbers)."""
+    phone = _NON_DIGIT.sub("", raw)
+    if len(phone) == 10:
+        return f"+1{phone}"
+    return f"+{phone}"
+
+def _set_next_cursor(response: Response, rows: list, column: str, limit: int) -> None:
+    """Expose the keyset cursor for the next page; list bodies stay plain arrays."""
+    cursor = next_cursor(rows, column, limit)
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
+
+def _check_cursor(cursor: Optional[str]) -> None:
+    """400 for a malformed cursor before it reaches a query filter."""
+    if cursor:
+        try:
+            db.check_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
 # ==================== AUTH ENDPOINTS ====================
 
 @app.post("/api/auth/user/login", response_model=TokenResponse)
 async def user_login(data: UserLogin):
     """Login/register as user with phone + name"""
-    phone = "".join(filter(str.isdigit, data.phone))
-    if len(phone) == 10:
-        phone = f"+1{phone}"
-    elif not phone.startswith("+"):
-        phone = f"+{phone}"
-    
-    user = db.get_or_create_user(phone, data.name)
-    
-    # Update name if different
-    if data.name != user.get("name"):
-        db.update_user(phone, name=data.name)
-        user["name"] = data.name
+    phone = _normalize_phone(data.phone)
+    user = await db.upsert_user(phone, data.name)
     
     token = create_token(phone, "user", {"name": user.get("name")})
     
@@ -201,12 +282,12 @@ async def user_login(data: UserLogin):
 @app.post("/api/auth/mentor/login", response_model=TokenResponse)
 async def mentor_login(data: MentorLogin):
     """Login as mentor"""
-    mentor = db.get_mentor_by_email(data.email)
+    mentor = await db.get_mentor_by_email(data.email)
     
     if not mentor:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    if not verify_password(data.password, mentor.get("password_hash", "")):
+    if not await run_in_threadpool(verify_password, data.password, mentor.get("password_hash", "")):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     token = create_token(str(mentor["id"]), "mentor", {"name": mentor["name"]})
@@ -225,15 +306,15 @@ async def mentor_login(data: MentorLogin):
 @app.post("/api/auth/admin/login", response_model=TokenResponse)
 async def admin_login(data: AdminLogin):
     """Login as admin"""
-    admin = db.get_admin_by_email(data.email)
+    admin = await db.get_admin_by_email(data.email)
     
     if not admin:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    if not verify_password(data.password, admin.get("password_hash", "")):
+    if not await run_in_threadpool(verify_password, data.password, admin.get("password_hash", "")):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    db.update_admin_login(admin["id"])
+    await db.update_admin_login(admin["id"])
     
     token = create_token(str(admin["id"]), "admin", {"role": admin.get("role")})
     
@@ -255,13 +336,15 @@ async def get_current_user(token: dict = Depends(verify_token)):
     user_id = token.get("sub")
     
     if user_type == "user":
-        user = db.get_or_create_user(user_id)
+        user = await db.get_user_by_phone(user_id)
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
         return {"type": "user", "user": user}
     elif user_type == "mentor":
-        mentor = db.get_mentor_by_id(user_id)
+        mentor = await db.get_mentor_public(user_id)
         return {"type": "mentor", "user": mentor}
     elif user_type == "admin":
-        admin = db.get_admin_by_id(user_id)
+        admin = await db.get_admin_by_id(user_id)
         return {"type": "admin", "user": admin}
     
     raise HTTPException(status_code=401, detail="Invalid token type")
@@ -270,25 +353,27 @@ async def get_current_user(token: dict = Depends(verify_token)):
 
 @app.get("/api/users")
 async def list_users(
-    skip: int = 0,
+    response: Response,
+    cursor: Optional[str] = None,
     limit: int = 50,
     token: dict = Depends(require_admin)
 ):
-    """List all users (admin only)"""
-    return db.list_users(skip=skip, limit=limit)
+    """List all users (admin only). Pass X-Next-Cursor back as cursor for the next page."""
+    _check_cursor(cursor)
+    users = await db.list_users(cursor=cursor, limit=limit)
+    _set_next_cursor(response, users, "created_at", limit)
+    return users
 
 @app.post("/api/users")
 async def create_user(data: UserCreate, token: dict = Depends(require_admin)):
     """Create a user (admin only)"""
-    user = db.get_or_create_user(data.contact_number, data.name)
-    if data.email:
-        db.update_user(data.contact_number, email=data.email)
-    return user
+    phone = _normalize_phone(data.contact_number)
+    return await db.create_user(phone, data.name, email=data.email)
 
 @app.get("/api/users/{phone}")
 async def get_user(phone: str, token: dict = Depends(verify_token)):
     """Get user by phone"""
-    user = db.get_user_by_phone(phone)
+    user = await db.get_user_by_phone(phone)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -296,7 +381,7 @@ async def get_user(phone: str, token: dict = Depends(verify_token)):
 @app.delete("/api/users/{phone}")
 async def delete_user(phone: str, token: dict = Depends(require_admin)):
     """Delete user (admin only)"""
-    success = db.delete_user(phone)
+    success = await db.delete_user(phone)
     if not success:
         raise HTTPException(status_code=404, detail="User not found")
     return {"message": "User deleted"}
@@ -309,7 +394,7 @@ async def get_user_sessions(phone: str, token: dict = Depends(verify_token)):
         raise HTTPException(status_code=403, detail="Access denied")
     
     try:
-        sessions = db.get_user_sessions(phone, limit=50)
+        sessions = await db.get_user_sessions(phone, limit=50)
         return sessions
     except Exception as e:
         # If database error, return empty list
@@ -327,7 +412,7 @@ async def get_user_appointments(
         raise HTTPException(status_code=403, detail="Access denied")
     
     statuses = [status] if status else None
-    appointments = db.get_user_appointments(phone, status=statuses)
+    appointments = await db.get_user_appointments(phone, status=statuses)
     return appointments
 
 # ==================== MENTOR ENDPOINTS ====================
@@ -335,19 +420,19 @@ async def get_user_appointments(
 @app.get("/api/mentors")
 async def list_mentors(active_only: bool = True):
     """List all mentors"""
-    return db.get_mentors(active_only=active_only)
+    return await db.get_mentors_public(active_only=active_only)
 
 @app.post("/api/mentors")
 async def create_mentor(data: MentorCreate, token: dict = Depends(require_admin)):
     """Create a mentor (admin only)"""
-    existing = db.get_mentor_by_email(data.email)
+    existing = await db.get_mentor_by_email(data.email)
     if existing:
         raise HTTPException(status_code=400, detail="Email already exists")
     
-    mentor = db.create_mentor(
+    mentor = await db.create_mentor(
         name=data.name,
         email=data.email,
-        password_hash=hash_password(data.password),
+        password_hash=await run_in_threadpool(hash_password, data.password),
         specialty=data.specialty,
         bio=data.bio,
         phone=data.phone
@@ -357,11 +442,9 @@ async def create_mentor(data: MentorCreate, token: dict = Depends(require_admin)
 @app.get("/api/mentors/{mentor_id}")
 async def get_mentor(mentor_id: str):
     """Get mentor details"""
-    mentor = db.get_mentor_by_id(mentor_id)
+    mentor = await db.get_mentor_public(mentor_id)
     if not mentor:
         raise HTTPException(status_code=404, detail="Mentor not found")
-    # Remove sensitive data
-    mentor.pop("password_hash", None)
     return mentor
 
 @app.put("/api/mentors/{mentor_id}")
@@ -376,14 +459,16 @@ async def update_mentor(
     if token.get("type") not in ["mentor", "admin"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    updates = {k: v for k, v in data.dict().items() if v is not None}
-    mentor = db.update_mentor(mentor_id, **updates)
+    updates = data.model_dump(exclude_unset=True)
+    if not updates:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    mentor = await db.update_mentor(mentor_id, **updates)
     return mentor
 
 @app.delete("/api/mentors/{mentor_id}")
 async def delete_mentor(mentor_id: str, token: dict = Depends(require_admin)):
     """Delete mentor (admin only)"""
-    success = db.delete_mentor(mentor_id)
+    success = await db.delete_mentor(mentor_id)
     if not success:
         raise HTTPException(status_code=404, detail="Mentor not found")
     return {"message": "Mentor deleted"}
@@ -397,7 +482,7 @@ async def get_mentor_availability(
     end_date: Optional[str] = None
 ):
     """Get mentor's availability"""
-    return db.get_mentor_availability(mentor_id, start_date, end_date)
+    return await db.get_mentor_availability(mentor_id, start_date, end_date)
 
 @app.post("/api/mentors/{mentor_id}/availability")
 async def add_mentor_availability(
@@ -409,7 +494,7 @@ async def add_mentor_availability(
     if token.get("sub") != mentor_id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    availability = db.add_mentor_availability(
+    availability = await db.add_mentor_availability(
         mentor_id=mentor_id,
         date_str=data.date,
         start_time=data.start_time,
@@ -428,7 +513,7 @@ async def remove_mentor_availability(
     if token.get("sub") != mentor_id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    success = db.remove_mentor_availability(availability_id)
+    success = await db.remove_mentor_availability(availability_id)
     if not success:
         raise HTTPException(status_code=404, detail="Availability not found")
     return {"message": "Availability removed"}
@@ -439,29 +524,37 @@ async def get_mentor_slots(
     date: str
 ):
     """Get available booking slots for a mentor on a date"""
-    return db.get_available_slots_for_mentor(mentor_id, date)
+    return await db.get_available_slots_for_mentor(mentor_id, date)
 
 # ==================== APPOINTMENT ENDPOINTS ====================
 
 @app.get("/api/appointments")
 async def list_appointments(
+    response: Response,
     status: Optional[str] = None,
     mentor_id: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
     token: dict = Depends(verify_token)
 ):
-    """List appointments (filtered based on user type)"""
+    """List appointments (filtered based on user type). Admins may page with
+    limit; pass X-Next-Cursor back as cursor for the next page."""
     user_type = token.get("type")
     
     if user_type == "user":
         phone = token.get("sub")
-        return db.get_user_appointments(phone, status=status)
+        return await db.get_user_appointments(phone, status=status)
     elif user_type == "mentor":
         m_id = token.get("sub")
-        return db.get_mentor_appointments(m_id, status, start_date, end_date)
+        return await db.get_mentor_appointments(m_id, status, start_date, end_date)
     elif user_type == "admin":
-        return db.list_all_appointments(status, mentor_id, start_date, end_date)
+        _check_cursor(cursor)
+        appointments = await db.list_all_appointments(status, mentor_id, start_date, end_date, cursor=cursor, limit=limit)
+        if limit:
+            _set_next_cursor(response, appointments, "date", limit)
+        return appointments
     
     raise HTTPException(status_code=403, detail="Access denied")
 
@@ -477,7 +570,7 @@ async def get_mentor_appointments_endpoint(
     if token.get("type") == "mentor" and token.get("sub") != mentor_id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    return db.get_mentor_appointments(mentor_id, status, start_date, end_date)
+    return await db.get_mentor_appointments(mentor_id, status, start_date, end_date)
 
 @app.get("/api/appointments/calendar")
 async def get_appointments_calendar(
@@ -490,12 +583,12 @@ async def get_appointments_calendar(
     if token.get("type") == "mentor" and token.get("sub") != mentor_id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    return db.get_mentor_calendar(mentor_id, year, month)
+    return await db.get_mentor_calendar(mentor_id, year, month)
 
 @app.get("/api/appointments/{appointment_id}")
 async def get_appointment(appointment_id: str, token: dict = Depends(verify_token)):
     """Get appointment details"""
-    appointment = db.get_appointment_by_id(appointment_id)
+    appointment = await db.get_appointment_by_id(appointment_id)
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
@@ -515,30 +608,41 @@ async def update_appointment(
     token: dict = Depends(verify_token)
 ):
     """Update appointment status or notes"""
-    appointment = db.get_appointment_by_id(appointment_id)
+    updates = data.model_dump(exclude_unset=True)
+    if not updates:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    
+    appointment = await db.get_appointment_by_id(appointment_id)
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
-    updates = {k: v for k, v in data.dict().items() if v is not None}
-    updated = db.update_appointment(appointment_id, **updates)
+    updated = await db.update_appointment(appointment_id, **updates)
     return updated
 
 # ==================== SESSION ENDPOINTS ====================
 
 @app.get("/api/sessions")
 async def list_sessions(
+    response: Response,
     status: Optional[str] = None,
-    skip: int = 0,
+    cursor: Optional[str] = None,
     limit: int = 50,
     token: dict = Depends(require_admin)
 ):
-    """List all sessions (admin only)"""
-    return db.list_all_sessions(status=status, skip=skip, limit=limit)
+    """List all sessions (admin only). Pass X-Next-Cursor back as cursor for the next page."""
+    _check_cursor(cursor)
+    sessions = await db.list_all_sessions(status=status, cursor=cursor, limit=limit)
+    _set_next_cursor(response, sessions, "started_at", limit)
+    return sessions
 
 @app.get("/api/sessions/{session_id}")
 async def get_session(session_id: str, token: dict = Depends(verify_token)):
     """Get session details with messages"""
-    session = db.get_session(session_id)
+    # Independent round trips - fetch both at once and check access afterwards
+    session, messages = await asyncio.gather(
+        db.get_session(session_id),
+        db.get_session_messages(session_id),
+    )
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
@@ -546,7 +650,6 @@ async def get_session(session_id: str, token: dict = Depends(verify_token)):
     if token.get("type") == "user" and session.get("contact_number") != token.get("sub"):
         raise HTTPException(status_code=403, detail="Access denied")
     
-    messages = db.get_session_messages(session_id)
     return {
         "session": session,
         "messages": messages
@@ -557,94 +660,138 @@ async def get_session(session_id: str, token: dict = Depends(verify_token)):
 @app.get("/api/admin/stats")
 async def get_admin_stats(token: dict = Depends(require_admin)):
     """Get dashboard statistics"""
-    return db.get_admin_stats()
+    return await db.get_admin_stats()
+
+@app.get("/api/admin/dashboard")
+async def get_admin_dashboard(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: int = 50,
+    token: dict = Depends(require_admin)
+):
+    """Get stats, daily costs and latest session costs in one call"""
+    return await db.get_admin_dashboard(start_date, end_date, limit)
 
 @app.get("/api/admin/costs")
 async def get_cost_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    group_by: str = "day",  # day, week, month
+    group_by: str = Query("day", pattern="^(day|week|month)$"),
     token: dict = Depends(require_admin)
 ):
-    """Get cost breakdown"""
-    return db.get_cost_report(start_date, end_date, group_by)
+    """Get cost breakdown. Served from the cost_summary_* rollups, which
+    pg_cron refreshes every 15 minutes, so the latest sessions may be missing."""
+    return await db.get_cost_report(start_date, end_date, group_by)
 
 @app.get("/api/admin/costs/sessions")
 async def get_session_costs(
-    skip: int = 0,
+    response: Response,
+    cursor: Optional[str] = None,
     limit: int = 50,
     token: dict = Depends(require_admin)
 ):
-    """Get per-session cost breakdown"""
-    return db.get_session_costs(skip=skip, limit=limit)
+    """Get per-session cost breakdown. Pass X-Next-Cursor back as cursor for the next page."""
+    _check_cursor(cursor)
+    sessions = await db.get_session_costs(cursor=cursor, limit=limit)
+    _set_next_cursor(response, sessions, "started_at", limit)
+    return sessions
+
+@app.get("/api/admin/costs/sessions/export")
+async def export_session_costs(token: dict = Depends(require_admin)):
+    """Stream every session's cost breakdown as one JSON array"""
+    async def body():
+        # Rows are encoded one at a time as pages arrive, so neither the row
+        # list nor the full JSON document is ever built in memory
+        yield b"["
+        sep = b""
+        async for row in db.iter_session_costs():
+            yield sep + orjson.dumps(row)
+            sep = b","
+        yield b"]"
+    return StreamingResponse(body(), media_type="application/json")
 
 # ==================== LIVEKIT TOKEN ENDPOINT ====================
 
+_ROOM_PREFIX = "voice-"
+
 @app.get("/api/livekit/token")
 async def get_livekit_token(token: dict = Depends(verify_token_optional)):
     """Get LiveKit room token for voice chat. Auth optional - user will be identified via voice."""
+    if livekit_api is None:
+        raise HTTPException(status_code=503, detail="LiveKit API not installed. Install: pip install livekit-api")
+    if not (settings.LIVEKIT_URL and settings.LIVEKIT_API_KEY and settings.LIVEKIT_API_SECRET):
+        raise HTTPException(status_code=500, detail="LiveKit configuration missing")
+    
+    # Get user info from token if available, otherwise use temp
+    user_phone = token.get("sub") if token else f"temp-{secrets.token_urlsafe(8)}"
+    user_name = token.get("name", "User") if token else "Guest"
+    
+    # Create unique room name
+    room_name = f"{_ROOM_PREFIX}{user_phone.lstrip('+')}-{secrets.token_urlsafe(8)}"
+    
     try:
-        from livekit import api as livekit_api
-        
-        # Get user info from token if available, otherwise use temp
-        user_phone = token.get("sub") if token else f"temp-{datetime.now().timestamp()}"
-        user_name = token.get("name", "User") if token else "Guest"
-        
-        # Create unique room name
-        room_name = f"voice-{user_phone.replace('+', '').replace('.', '')}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        
-        # Generate LiveKit token
-        livekit_url = os.getenv("LIVEKIT_URL")
-        api_key = os.getenv("LIVEKIT_API_KEY")
-        api_secret = os.getenv("LIVEKIT_API_SECRET")
-        
-        if not all([livekit_url, api_key, api_secret]):
-            raise HTTPException(status_code=500, detail="LiveKit configuration missing")
-        
         token_opts = livekit_api.VideoGrants(
             room_join=True,
             room=room_name,
         )
         
         participant_token = livekit_api.AccessToken(
-            api_key,
-            api_secret
+            settings.LIVEKIT_API_KEY,
+            settings.LIVEKIT_API_SECRET
         ).with_identity(user_phone).with_name(user_name).with_grants(token_opts).to_jwt()
-        
-        return {
-            "token": participant_token,
-            "room_name": room_name,
-            "livekit_url": livekit_url
-        }
-    except ImportError:
-        raise HTTPException(status_code=500, detail="LiveKit API not installed. Install: pip install livekit-api")
     except Exception as e:
         logger.error(f"Failed to generate LiveKit token: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to generate token: {str(e)}")
+    
+    return {
+        "token": participant_token,
+        "room_name": room_name,
+        "livekit_url": settings.LIVEKIT_URL
+    }
 
 # ==================== HEALTH CHECK ====================
 
+# Serialized once. Kept as bytes rather than a shared Response instance
+# because middleware (CORS) appends to a response's header list in place.
+_LIVE_BODY = b'{"status":"healthy"}'
+
+# Kept async: a plain def would be dispatched to the threadpool
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return ORJSONResponse({"status": "healthy", "timestamp": datetime.now().isoformat()})
+
+@app.get("/api/health/live")
+async def liveness():
+    """Liveness probe - static payload, no timestamp."""
+    return Response(_LIVE_BODY, media_type="application/json")
+
+# A successful connection test is reused for a few seconds so dashboards
+# polling this endpoint don't each trigger a Supabase round trip. Failures
+# are never cached.
+_db_status_cache: TTLCache = TTLCache(maxsize=1, ttl=5)
 
 @app.get("/api/db/status")
 async def db_status():
     """Check database connection status."""
+    cached = _db_status_cache.get("status")
+    if cached is not None:
+        return cached
+    
     status = {
         "enabled": db._enabled,
         "using_supabase": db._enabled and db.client is not None,
         "using_memory": not db._enabled,
-        "supabase_url_set": bool(os.getenv("SUPABASE_URL")),
-        "supabase_key_set": bool(os.getenv("SUPABASE_KEY")),
+        "supabase_url_set": bool(settings.SUPABASE_URL),
+        "supabase_key_set": bool(settings.SUPABASE_KEY),
     }
     
     if db._enabled and db.client:
         try:
             # Try a simple query to verify connection
-            db.client.table("users").select("id").limit(1).execute()
+            await db.client.table("users").select("id").limit(1).execute()
             status["connection_test"] = "success"
             status["message"] = "Connected to Supabase"
+            _db_status_cache["status"] = status
         except Exception as e:
             error_msg = str(e)
             if "not found" in error_msg.lower() or "does not exist" in error_msg.lower():
@@ -654,7 +801,7 @@ async def db_status():
                 status["connection_test"] = "failed"
                 status["message"] = f"Connection error: {error_msg}"
     else:
-        if not os.getenv("SUPABASE_URL") or not os.getenv("SUPABASE_KEY"):
+        if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
             status["message"] = "SUPABASE_URL and/or SUPABASE_KEY not set in .env"
         else:
             status["message"] = "Using in-memory storage"
@@ -666,7 +813,23 @@ async def db_status():
 if __name__ == "__main__":
     import uvicorn
     # Railway provides PORT env var, use 0.0.0.0 to accept external connections
-    port = int(os.getenv("PORT", "8000"))
-    host = os.getenv("HOST", "0.0.0.0")
-    uvicorn.run(app, host=host, port=port)
+    # Several processes get past the GIL, but each has its own Supabase pool
+    # and its own mentor/admin/stats/JWT caches; a write clears only the
+    # handling worker's, so the others serve old rows until their TTL runs
+    # out. In-memory storage is per process too, so only fan out when
+    # Supabase is configured. Neither sched_getaffinity nor cpu_count sees a
+    # container's CPU quota, hence the small cap; WEB_CONCURRENCY overrides.
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    default_workers = min(cores, 4) if settings.SUPABASE_URL else 1
+    uvicorn.run(
+        "api:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        # uvloop/httptools when installed (pyproject skips uvloop on Windows)
+        loop="auto",
+        http="auto",
+        workers=int(settings.WEB_CONCURRENCY or default_workers),
+        # Per-request stdout logging is synchronous; opt in with ACCESS_LOG=1
+        access_log=settings.ACCESS_LOG,
+    )
 
@@ -2,38 +2,309 @@
 Database operations for Voice Agent.
 Simplified with Supabase + in-memory fallback.
 """
-import os
+import asyncio
+import heapq
 import logging
-from datetime import datetime, timedelta
+import re
+import sys
+import time
+import httpx
+import orjson
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from operator import itemgetter
 from typing import Any
-from pathlib import Path
 
-# Load environment
-from dotenv import load_dotenv
-env_path = Path(__file__).parent.parent / ".env"
-load_dotenv(env_path) if env_path.exists() else load_dotenv()
+from cachetools import TTLCache
+
+import settings
 
 logger = logging.getLogger(__name__)
 
+# Mentor columns that are safe to hand to any client (never password_hash)
+MENTOR_PUBLIC_COLUMNS = ("id", "name", "email", "specialty", "bio", "phone", "is_active")
+_MENTOR_PUBLIC_SELECT = ",".join(MENTOR_PUBLIC_COLUMNS)
+
+# Columns the list views render. The large JSON columns (cost_breakdown,
+# metadata) are left to the single-row reads
+_APPOINTMENT_LIST_SELECT = "id, date, time, duration_minutes, status, notes, user_notes, mentor_notes, mentor_id, contact_number, users, mentors"
+_SESSION_LIST_SELECT = "id, room_name, contact_number, started_at, ended_at, duration_seconds, status, summary"
+# A caller's own appointments, as read by the agent tools and the chat page;
+# mentor_id feeds _attach_mentors and the modify tool
+_USER_APPOINTMENT_SELECT = "id, date, time, duration_minutes, status, notes, mentor_id, contact_number"
+
+
+def _public_mentor(m: dict) -> dict:
+    """Copy of an in-memory mentor row with only MENTOR_PUBLIC_COLUMNS.
+    
+    Rows fresh from Supabase are either selected with _MENTOR_PUBLIC_SELECT
+    or have password_hash popped in place; this is for the shared memory store.
+    """
+    return {k: m[k] for k in MENTOR_PUBLIC_COLUMNS if k in m}
+
+# ISO timestamp pinned for the current API request (set by the API's
+# middleware), so every write in one request shares a single clock read
+request_now: ContextVar[str | None] = ContextVar("request_now", default=None)
+
+
+def _now_iso() -> str:
+    """Current UTC time as ISO 8601, reusing the request's pinned value."""
+    return request_now.get() or datetime.now(timezone.utc).isoformat()
+
+
+def _parse_ts(value: str) -> datetime:
+    """Parse a stored timestamp; naive values are treated as UTC."""
+    # fromisoformat accepts the "Z" suffix natively on Python 3.11+
+    ts = datetime.fromisoformat(value)
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+# Appointment statuses that hold a slot
+ACTIVE_STATUSES = ("pending", "booked")
+
+# Circuit breaker around Supabase: more than _CB_MAX_FAILURES transport errors
+# within _CB_WINDOW seconds opens it; calls then go straight to memory for
+# _CB_COOLDOWN seconds, after which a single probe call decides whether to close
+_CB_MAX_FAILURES = 3
+_CB_WINDOW = 30.0
+_CB_COOLDOWN = 10.0
+
+# Attributes created by Database._init_memory
+_MEMORY_ATTRS = frozenset((
+    "_users", "_mentors", "_appointments", "_sessions",
+    "_messages", "_appts_by_id", "_appts_by_phone", "_appts_by_mentor",
+    "_slot_index", "_avail_by_id", "_avail_by_mentor", "_messages_by_session",
+    "_next_avail_id", "_appt_status_counts", "_active_sessions", "_session_cost_total",
+    "_inactive_users",
+))
+
+
+def next_cursor(rows: list, column: str, limit: int) -> str | None:
+    """Keyset cursor ("<column value>|<id>") after a full page, else None."""
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    return f"{last[column]}|{last['id']}"
+
+
+# Supabase row ids: UUIDs, or integers for serial keys
+_CURSOR_ID = re.compile(r"[0-9a-fA-F]{8}(?:-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12}|\d+")
+
+
+def parse_cursor(cursor: str, any_id: bool = False) -> tuple[str, str]:
+    """Split a next_cursor() value into (column value, id).
+    
+    Raises ValueError unless the value is an ISO date/timestamp and the id a
+    UUID or integer, since _keyset splices both into a PostgREST filter.
+    any_id skips the id check for the memory store, whose ids (phones,
+    "apt_N") are only ever compared in Python.
+    """
+    value, sep, last_id = cursor.rpartition("|")
+    if not sep or not last_id or not (any_id or _CURSOR_ID.fullmatch(last_id)):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    datetime.fromisoformat(value)
+    return value, last_id
+
+
+def _keyset(q, column: str, cursor: str | None, limit: int):
+    """Page q newest-first on (column, id), starting after cursor.
+    
+    Unlike range()/OFFSET, the database seeks straight to the cursor via the
+    (column DESC, id DESC) index instead of reading and discarding skipped rows.
+    """
+    if cursor:
+        value, last_id = parse_cursor(cursor)
+        q = q.or_(f'{column}.lt."{value}",and({column}.eq."{value}",id.lt."{last_id}")')
+    return q.order(column, desc=True).order("id", desc=True).limit(limit)
+
+
+def _keyset_memory(rows, column: str, cursor: str | None, limit: int) -> list:
+    """In-memory equivalent of _keyset: top `limit` via a heap, not a full sort."""
+    # Keys are built once per row and shared by the cursor filter and the heap;
+    # ids are unique, so ties never fall through to comparing the dicts
+    keyed = (((x.get(column) or "", x["id"]), x) for x in rows)
+    if cursor:
+        value, last_id = parse_cursor(cursor, any_id=True)
+        keyed = (kx for kx in keyed if kx[0] < (value, last_id))
+    return [x for _, x in heapq.nlargest(limit, keyed, key=itemgetter(0))]
+
+
+def _filter_appointments(apts, status=None, mentor_id=None, start_date=None, end_date=None) -> list:
+    """Apply the optional appointment filters in a single pass."""
+    if not (status or mentor_id or start_date or end_date):
+        return list(apts)
+    return [
+        a for a in apts
+        if (not status or a["status"] == status)
+        and (not mentor_id or a.get("mentor_id") == mentor_id)
+        and (not start_date or a["date"] >= start_date)
+        and (not end_date or a["date"] <= end_date)
+    ]
+
+
+# Pre-aggregated cost_logs rollups (materialized views in schema.sql) per
+# report granularity
+_COST_SUMMARY_VIEWS = {"day": "cost_summary_day", "week": "cost_summary_week", "month": "cost_summary_month"}
+
+
+# Write options for calls that only need to know whether a row matched:
+# PostgREST reports the affected-row count in a header and sends no body
+_COUNT_ONLY = {"count": "exact", "returning": "minimal"}
+
+
+@lru_cache(maxsize=256)
+def slot_times(start_time: str, end_time: str, step_minutes: int = 60) -> tuple:
+    """Slot start times ("HH:MM") in [start_time, end_time), step_minutes apart.
+
+    Accepts "HH:MM" or "HH:MM:SS" and works in integer minutes, so no
+    datetime objects are built per slot. Mentors reuse the same few windows,
+    so grids are memoized; the result is a tuple so callers can't mutate it.
+    """
+    start = int(start_time[:2]) * 60 + int(start_time[3:5])
+    end = int(end_time[:2]) * 60 + int(end_time[3:5])
+    return tuple(f"{m // 60:02d}:{m % 60:02d}" for m in range(start, end, step_minutes or 60))
+
+# Connection modes. This module talks to PostgREST over HTTPS, so Supabase
+# pools the Postgres connections server-side and there are no client-side
+# prepared statements to worry about. If a direct driver is ever added
+# (asyncpg / psycopg, e.g. behind SQLAlchemy), match it to the port:
+#   5432 direct / session pooler: a small client pool is fine
+#       (pool_size=3, max_overflow=2, pool_pre_ping=True, pool_recycle=1800)
+#   6543 transaction pooler: NullPool, and turn prepared statements off
+#       (statement_cache_size=0 and prepared_statement_cache_size=0 in
+#       connect_args), or bursts fail with 'prepared statement does not exist'
+
+class _OrjsonClient(httpx.AsyncClient):
+    """httpx client that encodes JSON request bodies with orjson.
+    
+    postgrest hands insert/update payloads (message tool_args/tool_result,
+    cost_breakdown, cost rows) to httpx as json=, which otherwise goes through
+    the stdlib encoder. Responses are already decoded by pydantic.
+    """
+    
+    def build_request(self, method, url, *, json=None, content=None, headers=None, **kwargs):
+        if json is not None and content is None:
+            content = orjson.dumps(json, option=orjson.OPT_NON_STR_KEYS)
+            headers = httpx.Headers(headers)
+            headers.setdefault("Content-Type", "application/json")
+        return super().build_request(method, url, content=content, headers=headers, **kwargs)
+
+
+# One Supabase client per process, shared by every Database instance, so
+# agent jobs and API workers reuse the same connection pool and subclients
+_client = None
+_http: httpx.AsyncClient | None = None
+# Serializes the first connect, so concurrent first callers share one client
+# and one probe instead of each building (and leaking) their own
+_client_lock = asyncio.Lock()
+
+
+async def _get_client(url: str, key: str):
+    """Return the process-wide async Supabase client, creating it on first use.
+    
+    The first call also probes the database; later callers (every agent job)
+    get the verified client without another round trip.
+    """
+    global _client, _http
+    if _client is not None:
+        return _client
+    async with _client_lock:
+        if _client is None:
+            from supabase import acreate_client, AsyncClientOptions
+            # One pooled HTTP/2 client shared by every PostgREST call, so requests
+            # reuse keep-alive connections instead of paying a TLS handshake each
+            _http = _OrjsonClient(
+                limits=httpx.Limits(
+                    max_connections=settings.SUPABASE_POOL_SIZE,
+                    max_keepalive_connections=settings.SUPABASE_POOL_KEEPALIVE,
+                    keepalive_expiry=settings.SUPABASE_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(settings.SUPABASE_TIMEOUT),
+                http2=True,
+                follow_redirects=True,
+            )
+            client = await acreate_client(url, key, options=AsyncClientOptions(httpx_client=_http))
+            if not settings.SUPABASE_SKIP_PING:
+                try:
+                    await client.table("users").select("id").limit(1).execute()
+                except Exception:
+                    await close_client()
+                    raise
+            _client = client
+    return _client
+
+
+async def close_client():
+    """Close the shared client's HTTP pool. Call once at process shutdown."""
+    global _client, _http
+    if _http is not None:
+        await _http.aclose()
+    _client = _http = None
+
 
 class Database:
     """Supabase database with automatic in-memory fallback."""
     
+    _instance: "Database | None" = None
+    
+    @classmethod
+    def get(cls) -> "Database":
+        """The process-wide Database, so caches and the in-memory store are
+        shared by every caller instead of rebuilt per request or job."""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+    
     def __init__(self):
-        url = os.getenv("SUPABASE_URL", "").strip()
-        key = os.getenv("SUPABASE_KEY", "").strip()
-        
+        self._url = settings.SUPABASE_URL
+        self._key = settings.SUPABASE_KEY
         self.client = None
         self._enabled = False
-        self._init_memory()
-        
+        self._cb_state = "closed"
+        self._cb_opened_at = 0.0
+        self._cb_failures = 0
+        self._cb_window_start = 0.0
+        # Mentor and admin rows are read on nearly every request and change
+        # rarely. Mentor writes below clear the mentor cache.
+        self._mentor_cache: TTLCache = TTLCache(maxsize=256, ttl=60)
+        self._admin_cache: TTLCache = TTLCache(maxsize=64, ttl=30)
+        # get_or_create_user runs several times per conversation for the same
+        # phone. User writes below refresh or drop the entry. Only Supabase
+        # rows are cached: link_session_to_user writes the cached id into the
+        # UUID column sessions.user_id, and a memory row's id is the phone.
+        self._user_cache: TTLCache = TTLCache(maxsize=4096, ttl=120)
+        # Dashboard aggregates (admin stats, cost report). Most writes come
+        # from the agent process, so the TTL bounds staleness; every user,
+        # mentor, appointment, session and cost write made here clears it.
+        self._stats_cache: TTLCache = TTLCache(maxsize=64, ttl=30)
+        # A caller's appointments, read repeatedly within a conversation
+        # (context load, retrieve/cancel/modify tools). Keyed (phone, statuses);
+        # appointment writes below drop the entries they affect. Opt-in via
+        # get_user_appointments(cached=True), which only the agent uses: its
+        # writes can't invalidate the API processes' copies, so API reads
+        # stay uncached.
+        self._appts_cache: TTLCache = TTLCache(maxsize=1024, ttl=30)
+        # The in-memory store is built on first use (see __getattr__), so a
+        # process that stays on Supabase never allocates it
+    
+    def __getattr__(self, name: str):
+        # Only called for attributes that aren't set yet
+        if name in _MEMORY_ATTRS:
+            self._init_memory()
+            return object.__getattribute__(self, name)
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+    
+    async def connect(self):
+        """Attach to the shared async Supabase client. Falls back to memory on failure."""
+        if self._enabled:
+            return
+        url, key = self._url, self._key
         if url and key and url.startswith("https://") and ".supabase.co" in url:
             try:
-                from supabase import create_client
                 print(f"🔗 Connecting to Supabase at {url}...")
-                self.client = create_client(url, key)
-                # Test connection
-                self.client.table("users").select("id").limit(1).execute()
+                self.client = await _get_client(url, key)
                 print("✅ Successfully connected to Supabase!")
                 self._enabled = True
             except Exception as e:
@@ -50,88 +321,329 @@ class Database:
         self._appointments: list = []
         self._sessions: dict = {}
         self._messages: list = []
-        self._availability: list = []
+        # Secondary indexes over the same dicts, so lookups don't scan the lists
+        self._appts_by_id: dict = {}
+        self._appts_by_phone: dict = {}   # phone -> [apt]
+        self._appts_by_mentor: dict = {}  # mentor_id -> [apt]
+        self._slot_index: dict = {}       # (date, time) -> [active apt]
+        self._avail_by_id: dict = {}
+        self._avail_by_mentor: dict = {}  # mentor_id -> [availability]
+        self._messages_by_session: dict = {}  # session_id -> [message]
+        self._next_avail_id = 1
+        # Running aggregates for get_admin_stats, updated on every write
+        self._appt_status_counts: Counter = Counter()
+        self._active_sessions: dict = {}  # session_id -> parsed started_at
+        self._session_cost_total = 0
+        self._inactive_users: set = set()  # phones; users are active by default
     
-    def _db(self, supabase_fn, memory_fn):
-        """Execute Supabase query with memory fallback."""
-        if self._enabled:
+    def _memory_user(self, phone: str, now: str, **defaults) -> dict:
+        """The in-memory user for phone, created at `now` if missing. Callers
+        read the clock once per write and pass it in."""
+        user = self._users.get(phone)
+        if user is None:
+            user = self._users[phone] = {"id": phone, "contact_number": phone, "is_active": True, "created_at": now, **defaults}
+        return user
+    
+    def _update_memory_session(self, session: dict, changes: dict):
+        """Apply changes to an in-memory session, keeping the aggregates in sync."""
+        if "cost" in changes:
+            self._session_cost_total += changes["cost"] - session.get("cost", 0)
+        session.update(changes)
+        if session.get("status") == "active":
+            if session["id"] not in self._active_sessions:
+                self._active_sessions[session["id"]] = _parse_ts(session["started_at"])
+        else:
+            self._active_sessions.pop(session["id"], None)
+    
+    def _index_slot(self, apt: dict):
+        if apt["status"] in ACTIVE_STATUSES:
+            self._slot_index.setdefault((apt["date"], apt["time"]), []).append(apt)
+    
+    def _unindex_slot(self, apt: dict):
+        key = (apt["date"], apt["time"])
+        slot = [a for a in self._slot_index.get(key, ()) if a is not apt]
+        if slot:
+            self._slot_index[key] = slot
+        else:
+            self._slot_index.pop(key, None)
+    
+    def _add_memory_appointment(self, apt: dict):
+        # Interned statuses let the filters' == checks succeed on identity
+        apt["status"] = sys.intern(apt["status"])
+        self._appointments.append(apt)
+        self._appts_by_id[apt["id"]] = apt
+        self._appts_by_phone.setdefault(apt["contact_number"], []).append(apt)
+        self._appts_by_mentor.setdefault(apt.get("mentor_id"), []).append(apt)
+        self._appt_status_counts[apt["status"]] += 1
+        self._index_slot(apt)
+    
+    def _update_memory_appointment(self, apt: dict, changes: dict):
+        """Apply changes to an in-memory appointment, keeping the indexes in sync."""
+        self._unindex_slot(apt)
+        new_mentor = changes.get("mentor_id", apt.get("mentor_id"))
+        if new_mentor != apt.get("mentor_id"):
+            old = self._appts_by_mentor.get(apt.get("mentor_id"), [])
+            self._appts_by_mentor[apt.get("mentor_id")] = [a for a in old if a is not apt]
+            self._appts_by_mentor.setdefault(new_mentor, []).append(apt)
+        self._appt_status_counts[apt["status"]] -= 1
+        if "status" in changes:
+            changes = {**changes, "status": sys.intern(changes["status"])}
+        apt.update(changes)
+        self._appt_status_counts[apt["status"]] += 1
+        self._index_slot(apt)
+    
+    async def _cached(self, cache: TTLCache, key, from_db, from_memory):
+        """Return cache[key], else run the query through _db.
+        
+        Only results that came from Supabase fill the cache; memory-fallback
+        rows (seed mentors, the default admin, phone-keyed users) are served
+        once and never outlive the outage.
+        """
+        value = cache.get(key)
+        if value is None:
+            async def fill():
+                result = await from_db()
+                if result is not None:
+                    cache[key] = result
+                return result
+            value = await self._db(fill, from_memory)
+        return value
+    
+    def check_cursor(self, cursor: str) -> None:
+        """Raise ValueError for a cursor this store could not have issued."""
+        parse_cursor(cursor, any_id=not self._enabled)
+    
+    def _circuit_allows(self) -> bool:
+        """Whether a call may go to Supabase right now (see _CB_* above)."""
+        if not self._enabled:
+            return False
+        if self._cb_state == "closed":
+            return True
+        now = time.monotonic()
+        if now - self._cb_opened_at >= _CB_COOLDOWN:
+            # This caller is the half-open probe; others keep using memory
+            # (a probe that never reports back is replaced after a cooldown)
+            self._cb_state, self._cb_opened_at = "half_open", now
+            return True
+        return False
+    
+    def _record_db_result(self, error: Exception | None) -> None:
+        """Feed a Supabase call's outcome to the circuit breaker."""
+        if error is None:
+            if self._cb_state != "closed":
+                logger.warning("Supabase reachable again, closing circuit")
+            self._cb_state, self._cb_failures = "closed", 0
+            return
+        # Query/constraint errors mean the database answered; only transport
+        # failures (timeouts, refused connections) count toward an outage
+        if not isinstance(error, httpx.TransportError):
+            if self._cb_state == "half_open":
+                self._cb_state, self._cb_failures = "closed", 0
+            return
+        logger.warning(f"Supabase unreachable, using memory: {error!r}")
+        now = time.monotonic()
+        if now - self._cb_window_start > _CB_WINDOW:
+            self._cb_window_start, self._cb_failures = now, 0
+        self._cb_failures += 1
+        if self._cb_state == "half_open" or self._cb_failures > _CB_MAX_FAILURES:
+            if self._cb_state != "open":
+                logger.warning(f"Opening Supabase circuit for {_CB_COOLDOWN:.0f}s")
+            self._cb_state, self._cb_opened_at = "open", now
+    
+    async def _db(self, supabase_fn, memory_fn):
+        """Execute Supabase query with memory fallback.
+        
+        Memory serves the call only while Supabase is disabled, the circuit
+        is open, or the call fails in transport. Query and constraint errors
+        (PostgREST APIError and the like) are re-raised: answering them from
+        memory would report a write that never reached the database.
+        """
+        if self._circuit_allows():
             try:
-                return supabase_fn()
-            except Exception:
-                pass
+                result = await supabase_fn()
+            except Exception as e:
+                self._record_db_result(e)
+                if not isinstance(e, httpx.TransportError):
+                    raise
+            else:
+                self._record_db_result(None)
+                return result
         return memory_fn()
     
     # ==================== USERS ====================
     
-    def get_or_create_user(self, phone: str, name: str = "User") -> dict:
-        """Get existing user or create new one."""
-        def from_db():
-            res = self.client.table("users").select("*").eq("contact_number", phone).execute()
-            if res.data:
-                return res.data[0]
-            data = {"contact_number": phone, "name": name, "is_active": True}
-            return self.client.table("users").insert(data).execute().data[0]
+    async def get_or_create_user(self, phone: str, name: str = "User") -> dict:
+        """Get existing user or create new one.
+        
+        On Supabase the get_or_create_user SQL function does the lookup and
+        the insert in one round trip; an existing user's name is kept.
+        """
+        async def from_db():
+            res = await self.client.rpc("get_or_create_user", {"p_phone": phone, "p_name": name}).execute()
+            return res.data[0]
         
         def from_memory():
             if phone not in self._users:
-                self._users[phone] = {"id": phone, "contact_number": phone, "name": name, "is_active": True}
+                self._users[phone] = {"id": phone, "contact_number": phone, "name": name, "is_active": True, "created_at": _now_iso()}
             return self._users[phone]
         
-        return self._db(from_db, from_memory)
+        return await self._cached(self._user_cache, phone, from_db, from_memory)
+    
+    async def upsert_user(self, phone: str, name: str) -> dict:
+        """Create the user or update their name in a single round trip."""
+        data = {"contact_number": phone, "name": name}
+        async def from_db():
+            res = await self.client.table("users").upsert(data, on_conflict="contact_number").execute()
+            user = self._user_cache[phone] = res.data[0]
+            return user
+        
+        def from_memory():
+            now = _now_iso()
+            user = self._memory_user(phone, now)
+            user.update(data, updated_at=now)
+            # Fallback rows are never cached (see _cached)
+            self._user_cache.pop(phone, None)
+            return user
+        
+        user = await self._db(from_db, from_memory)
+        self._stats_cache.clear()
+        return user
     
-    def get_user_by_phone(self, phone: str) -> dict | None:
-        def from_db():
-            res = self.client.table("users").select("*").eq("contact_number", phone).execute()
+    async def create_user(self, phone: str, name: str, email: str = None) -> dict:
+        """Create a user, or overwrite name/email if the number already exists."""
+        data = {"contact_number": phone, "name": name}
+        if email:
+            data["email"] = email
+        async def from_db():
+            res = await self.client.table("users").upsert(data, on_conflict="contact_number").execute()
+            user = self._user_cache[phone] = res.data[0]
+            return user
+        
+        def from_memory():
+            user = self._memory_user(phone, _now_iso())
+            user.update(data)
+            # Fallback rows are never cached (see _cached)
+            self._user_cache.pop(phone, None)
+            return user
+        
+        user = await self._db(from_db, from_memory)
+        self._stats_cache.clear()
+        return user
+    
+    async def get_user_by_phone(self, phone: str) -> dict | None:
+        async def from_db():
+            res = await self.client.table("users").select("*").eq("contact_number", phone).execute()
             return res.data[0] if res.data else None
-        return self._db(from_db, lambda: self._users.get(phone))
+        return await self._db(from_db, lambda: self._users.get(phone))
     
-    def update_user(self, phone: str, **kwargs) -> dict:
-        kwargs["updated_at"] = datetime.now().isoformat()
-        def from_db():
-            res = self.client.table("users").update(kwargs).eq("contact_number", phone).execute()
-            return res.data[0] if res.data else {}
+    async def update_user(self, phone: str, **kwargs) -> dict:
+        # updated_at is set by the users_updated_at trigger on Supabase
+        async def from_db():
+            res = await self.client.table("users").update(kwargs).eq("contact_number", phone).execute()
+            if res.data:
+                self._user_cache[phone] = res.data[0]
+                return res.data[0]
+            self._user_cache.pop(phone, None)
+            return {}
         def from_memory():
+            self._user_cache.pop(phone, None)
             if phone in self._users:
-                self._users[phone].update(kwargs)
+                self._users[phone].update(kwargs, updated_at=_now_iso())
+                if self._users[phone].get("is_active", True):
+                    self._inactive_users.discard(phone)
+                else:
+                    self._inactive_users.add(phone)
             return self._users.get(phone, {})
-        return self._db(from_db, from_memory)
+        user = await self._db(from_db, from_memory)
+        self._stats_cache.clear()
+        return user
     
-    def list_users(self, skip: int = 0, limit: int = 50) -> list:
-        def from_db():
-            return self.client.table("users").select("*").range(skip, skip + limit - 1).execute().data or []
-        return self._db(from_db, lambda: list(self._users.values())[skip:skip + limit])
+    async def list_users(self, cursor: str = None, limit: int = 50) -> list:
+        """Newest users first; pass next_cursor() of a page to get the next one."""
+        async def from_db():
+            return (await _keyset(self.client.table("users").select("*"), "created_at", cursor, limit).execute()).data or []
+        return await self._db(from_db, lambda: _keyset_memory(self._users.values(), "created_at", cursor, limit))
     
     # ==================== MENTORS ====================
     
-    def get_mentors(self, active_only: bool = True) -> list:
-        def from_db():
+    async def get_mentors(self, active_only: bool = True) -> list:
+        async def from_db():
             q = self.client.table("mentors").select("id, name, email, specialty, is_active")
             if active_only:
                 q = q.eq("is_active", True)
-            return q.execute().data or []
+            return (await q.execute()).data or []
         def from_memory():
-            mentors = list(self._mentors.values())
-            return [m for m in mentors if m.get("is_active")] if active_only else mentors
-        return self._db(from_db, from_memory)
+            return [_public_mentor(m) for m in self._mentors.values() if m.get("is_active") or not active_only]
+        return await self._cached(self._mentor_cache, ("list", active_only), from_db, from_memory)
     
-    def get_mentor_by_id(self, mentor_id: str) -> dict | None:
-        def from_db():
-            res = self.client.table("mentors").select("*").eq("id", mentor_id).execute()
+    async def get_mentors_public(self, active_only: bool = True) -> list:
+        """Mentor list projected to MENTOR_PUBLIC_COLUMNS by the query itself."""
+        async def from_db():
+            q = self.client.table("mentors").select(_MENTOR_PUBLIC_SELECT)
+            if active_only:
+                q = q.eq("is_active", True)
+            return (await q.execute()).data or []
+        def from_memory():
+            return [
+                _public_mentor(m)
+                for m in self._mentors.values()
+                if m.get("is_active") or not active_only
+            ]
+        return await self._cached(self._mentor_cache, ("public_list", active_only), from_db, from_memory)
+    
+    async def get_mentor_public(self, mentor_id: str) -> dict | None:
+        async def from_db():
+            res = await self.client.table("mentors").select(_MENTOR_PUBLIC_SELECT).eq("id", mentor_id).execute()
             return res.data[0] if res.data else None
-        return self._db(from_db, lambda: self._mentors.get(mentor_id))
+        def from_memory():
+            m = self._mentors.get(mentor_id)
+            return _public_mentor(m) if m else None
+        return await self._cached(self._mentor_cache, ("public", mentor_id), from_db, from_memory)
     
-    def get_mentor_by_email(self, email: str) -> dict | None:
-        def from_db():
-            res = self.client.table("mentors").select("*").eq("email", email).execute()
+    async def _attach_mentors(self, appointments: list, fields: tuple) -> list:
+        """Set appointment["mentors"] (the shape a mentors(...) embed would give).
+
+        Mentor rows repeat across appointments, so they are fetched once per
+        distinct id, from the mentor cache where possible, then stitched in.
+        """
+        mentor_ids = {a["mentor_id"] for a in appointments if a.get("mentor_id")}
+        mentors, missing = {}, []
+        for mid in mentor_ids:
+            m = self._mentor_cache.get(("public", mid))
+            if m is None:
+                missing.append(mid)
+            else:
+                mentors[mid] = m
+        if missing:
+            res = await self.client.table("mentors").select(_MENTOR_PUBLIC_SELECT).in_("id", missing).execute()
+            for m in res.data or []:
+                self._mentor_cache[("public", m["id"])] = m
+                mentors[m["id"]] = m
+        for apt in appointments:
+            m = mentors.get(apt.get("mentor_id"))
+            apt["mentors"] = {k: m.get(k) for k in fields} if m else None
+        return appointments
+    
+    async def get_mentor_by_id(self, mentor_id: str) -> dict | None:
+        async def from_db():
+            res = await self.client.table("mentors").select("*").eq("id", mentor_id).execute()
+            return res.data[0] if res.data else None
+        return await self._cached(self._mentor_cache, ("id", mentor_id), from_db, lambda: self._mentors.get(mentor_id))
+    
+    async def get_mentor_by_email(self, email: str) -> dict | None:
+        async def from_db():
+            res = await self.client.table("mentors").select("*").eq("email", email).execute()
             return res.data[0] if res.data else None
         def from_memory():
             return next((m for m in self._mentors.values() if m.get("email") == email), None)
-        return self._db(from_db, from_memory)
+        return await self._cached(self._mentor_cache, ("email", email), from_db, from_memory)
     
-    def create_mentor(self, name: str, email: str, password_hash: str, specialty: str = None) -> dict:
-        data = {"name": name, "email": email, "password_hash": password_hash, "specialty": specialty, "is_active": True}
-        def from_db():
-            res = self.client.table("mentors").insert(data).execute()
+    async def create_mentor(self, name: str, email: str, password_hash: str, specialty: str = None,
+                            bio: str = None, phone: str = None) -> dict:
+        data = {"name": name, "email": email, "password_hash": password_hash, "specialty": specialty,
+                "bio": bio, "phone": phone, "is_active": True}
+        async def from_db():
+            res = await self.client.table("mentors").insert(data).execute()
             m = res.data[0] if res.data else {}
             m.pop("password_hash", None)
             return m
@@ -139,514 +651,614 @@ class Database:
             mid = str(len(self._mentors) + 1)
             data["id"] = mid
             self._mentors[mid] = data
-            return {k: v for k, v in data.items() if k != "password_hash"}
-        return self._db(from_db, from_memory)
+            return _public_mentor(data)
+        result = await self._db(from_db, from_memory)
+        self._mentor_cache.clear()
+        self._stats_cache.clear()
+        return result
     
     # ==================== APPOINTMENTS ====================
     
-    def is_slot_booked(self, date_str: str, time_str: str, mentor_id: str = None) -> bool:
-        def from_db():
-            q = self.client.table("appointments").select("id").eq("date", date_str).eq("time", time_str).in_("status", ["pending", "booked"])
+    async def is_slot_booked(self, date_str: str, time_str: str, mentor_id: str = None) -> bool:
+        async def from_db():
+            q = self.client.table("appointments").select("id").eq("date", date_str).eq("time", time_str).in_("status", ACTIVE_STATUSES)
             if mentor_id:
                 q = q.eq("mentor_id", mentor_id)
-            return bool(q.execute().data)
+            # Existence check: one row is enough, served by uq_appointments_active_slot
+            return bool((await q.limit(1).execute()).data)
         def from_memory():
-            return any(
-                a["date"] == date_str and a["time"] == time_str and a["status"] in ("pending", "booked")
-                for a in self._appointments
-            )
-        return self._db(from_db, from_memory)
+            slot = self._slot_index.get((date_str, time_str), ())
+            return any(a.get("mentor_id") == mentor_id for a in slot) if mentor_id else bool(slot)
+        return await self._db(from_db, from_memory)
     
-    def is_mentor_available(self, mentor_id: str, date_str: str, time_str: str) -> bool:
+    async def get_booked_times(self, mentor_id: str, date_str: str) -> set:
+        """Times ("HH:MM") already taken for a mentor on a date, in one query."""
+        async def from_db():
+            res = await self.client.table("appointments").select("time").eq("date", date_str).eq("mentor_id", mentor_id).in_("status", ACTIVE_STATUSES).execute()
+            # TIME columns come back as HH:MM:SS
+            return {r["time"][:5] for r in res.data or []}
+        def from_memory():
+            return {
+                a["time"] for a in self._appts_by_mentor.get(mentor_id, ())
+                if a["date"] == date_str and a["status"] in ACTIVE_STATUSES
+            }
+        return await self._db(from_db, from_memory)
+    
+    async def get_booked_slots(self, mentor_id: str, start_date: str, end_date: str) -> set:
+        """(date, "HH:MM") pairs already taken for a mentor across a date range, in one query."""
+        async def from_db():
+            res = await (self.client.table("appointments").select("date, time").eq("mentor_id", mentor_id)
+                         .gte("date", start_date).lte("date", end_date).in_("status", ACTIVE_STATUSES).execute())
+            return {(r["date"], r["time"][:5]) for r in res.data or []}
+        def from_memory():
+            return {
+                (a["date"], a["time"]) for a in self._appts_by_mentor.get(mentor_id, ())
+                if start_date <= a["date"] <= end_date and a["status"] in ACTIVE_STATUSES
+            }
+        return await self._db(from_db, from_memory)
+    
+    async def is_mentor_available(self, mentor_id: str, date_str: str, time_str: str) -> bool:
         """Check if mentor has availability set for the given date and time."""
-        def from_db():
-            # Check if mentor has availability entry for this date
-            avail = self.client.table("mentor_availability").select("*").eq("mentor_id", mentor_id).eq("date", date_str).eq("is_available", True).execute()
-            if not avail.data:
-                return False
-            
-            # Check if time is within any availability window
-            try:
-                from datetime import datetime, time as dt_time
-                slot_time = datetime.strptime(time_str, "%H:%M").time()
-                for a in avail.data:
-                    start = datetime.strptime(a["start_time"], "%H:%M:%S").time()
-                    end = datetime.strptime(a["end_time"], "%H:%M:%S").time()
-                    if start <= slot_time < end:
-                        return True
-            except Exception as e:
-                logger.debug(f"Error checking mentor availability: {e}")
-            return False
+        async def from_db():
+            # The window check runs in Postgres on TIME values; one row is enough
+            res = await (
+                self.client.table("mentor_availability").select("id")
+                .eq("mentor_id", mentor_id).eq("date", date_str).eq("is_available", True)
+                .lte("start_time", time_str).gt("end_time", time_str)
+                .limit(1).execute()
+            )
+            return bool(res.data)
         
         def from_memory():
             # In-memory: assume available if not in booked list
             return True
         
-        return self._db(from_db, from_memory)
-    
-    def book_appointment(self, phone: str, date_str: str, time_str: str, mentor_id: str = None, notes: str = None, duration_minutes: int = 60) -> dict:
-        user = self.get_or_create_user(phone)
-        data = {
-            "user_id": user.get("id"),
-            "contact_number": phone,
-            "date": date_str,
-            "time": time_str,
-            "duration_minutes": duration_minutes,
-            "status": "booked",
-            "mentor_id": mentor_id,
-            "notes": notes,
-        }
-        def from_db():
-            return self.client.table("appointments").insert(data).execute().data[0]
+        return await self._db(from_db, from_memory)
+    
+    async def book_appointment(self, phone: str, date_str: str, time_str: str, mentor_id: str = None, notes: str = None, duration_minutes: int = 60) -> dict | None:
+        """Book an appointment, registering the phone as a user if it's new.
+        Returns None if the mentor already has an active appointment in that slot.
+        
+        On Supabase the book_appointment SQL function does both in one
+        statement instead of a user lookup/insert followed by the insert, and
+        the slot conflict is settled by its ON CONFLICT, so there is no window
+        between a separate check and the insert. A mentor is required: with a
+        NULL mentor_id the unique slot index never conflicts, so nothing would
+        stop a double booking.
+        """
+        if not mentor_id:
+            raise ValueError("book_appointment requires a mentor_id")
+        async def from_db():
+            res = await self.client.rpc("book_appointment", {
+                "p_phone": phone,
+                "p_date": date_str,
+                "p_time": time_str,
+                "p_mentor_id": mentor_id,
+                "p_notes": notes,
+                "p_duration": duration_minutes,
+            }).execute()
+            return res.data[0] if res.data else None
         def from_memory():
-            data["id"] = f"apt_{len(self._appointments) + 1}"
-            self._appointments.append(data)
+            if any(a.get("mentor_id") == mentor_id for a in self._slot_index.get((date_str, time_str), ())):
+                return None
+            user = self._memory_user(phone, _now_iso(), name="User")
+            data = {
+                "id": f"apt_{len(self._appointments) + 1}",
+                "user_id": user["id"],
+                "contact_number": phone,
+                "date": date_str,
+                "time": time_str,
+                "duration_minutes": duration_minutes,
+                "status": "booked",
+                "mentor_id": mentor_id,
+                "notes": notes,
+            }
+            self._add_memory_appointment(data)
             return data
-        return self._db(from_db, from_memory)
+        result = await self._db(from_db, from_memory)
+        if result:
+            self._stats_cache.clear()
+            self._forget_appointments(phone)
+        return result
+    
+    def _forget_appointments(self, phone: str = None):
+        """Drop cached get_user_appointments results for phone (all if None)."""
+        if phone is None:
+            self._appts_cache.clear()
+            return
+        for key in [k for k in self._appts_cache if k[0] == phone]:
+            self._appts_cache.pop(key, None)
     
-    def get_user_appointments(self, phone: str, status: list | str = None) -> list:
-        def from_db():
-            q = self.client.table("appointments").select("*, mentors(name, specialty)").eq("contact_number", phone)
+    async def get_user_appointments(self, phone: str, status: tuple | list | str = None, cached: bool = False) -> list:
+        """A caller's appointments by date/time; cached=True reads through _appts_cache."""
+        async def from_db():
+            q = self.client.table("appointments").select(_USER_APPOINTMENT_SELECT).eq("contact_number", phone)
             if status:
                 q = q.in_("status", [status] if isinstance(status, str) else status)
-            return q.order("date").order("time").execute().data or []
+            apts = (await q.order("date").order("time").execute()).data or []
+            return await self._attach_mentors(apts, ("name", "specialty"))
         def from_memory():
-            apts = [a for a in self._appointments if a["contact_number"] == phone]
+            apts = self._appts_by_phone.get(phone, [])
             if status:
                 statuses = [status] if isinstance(status, str) else status
                 apts = [a for a in apts if a["status"] in statuses]
             return sorted(apts, key=lambda x: (x["date"], x["time"]))
-        return self._db(from_db, from_memory)
+        if not cached:
+            return await self._db(from_db, from_memory)
+        status_key = (status,) if isinstance(status, str) else tuple(status) if status else None
+        return await self._cached(self._appts_cache, (phone, status_key), from_db, from_memory)
     
-    def cancel_appointment(self, phone: str, date_str: str, time_str: str) -> bool:
-        def from_db():
-            res = self.client.table("appointments").update({"status": "cancelled"}).eq("contact_number", phone).eq("date", date_str).eq("time", time_str).in_("status", ["pending", "booked"]).execute()
-            return bool(res.data)
+    async def cancel_appointment(self, phone: str, date_str: str, time_str: str) -> bool:
+        async def from_db():
+            res = await self.client.table("appointments").update({"status": "cancelled"}, **_COUNT_ONLY).eq("contact_number", phone).eq("date", date_str).eq("time", time_str).in_("status", ACTIVE_STATUSES).execute()
+            return bool(res.count)
         def from_memory():
-            for apt in self._appointments:
-                if apt["contact_number"] == phone and apt["date"] == date_str and apt["time"] == time_str and apt["status"] in ("pending", "booked"):
-                    apt["status"] = "cancelled"
+            for apt in self._appts_by_phone.get(phone, ()):
+                if apt["date"] == date_str and apt["time"] == time_str and apt["status"] in ACTIVE_STATUSES:
+                    self._update_memory_appointment(apt, {"status": "cancelled"})
                     return True
             return False
-        return self._db(from_db, from_memory)
+        result = await self._db(from_db, from_memory)
+        self._stats_cache.clear()
+        self._forget_appointments(phone)
+        return result
     
-    def cancel_appointment_by_id(self, appointment_id: str) -> bool:
+    async def cancel_appointment_by_id(self, appointment_id: str) -> bool:
         """Cancel appointment by ID."""
-        def from_db():
-            res = self.client.table("appointments").update({"status": "cancelled"}).eq("id", appointment_id).in_("status", ["pending", "booked"]).execute()
-            return bool(res.data)
+        async def from_db():
+            res = await self.client.table("appointments").update({"status": "cancelled"}, **_COUNT_ONLY).eq("id", appointment_id).in_("status", ACTIVE_STATUSES).execute()
+            return bool(res.count)
         def from_memory():
-            for apt in self._appointments:
-                if apt.get("id") == appointment_id and apt["status"] in ("pending", "booked"):
-                    apt["status"] = "cancelled"
-                    return True
+            apt = self._appts_by_id.get(appointment_id)
+            if apt and apt["status"] in ACTIVE_STATUSES:
+                self._update_memory_appointment(apt, {"status": "cancelled"})
+                return True
             return False
-        return self._db(from_db, from_memory)
+        result = await self._db(from_db, from_memory)
+        self._stats_cache.clear()
+        self._forget_appointments()
+        return result
     
-    def modify_appointment(self, phone: str, old_date: str, old_time: str, new_date: str, new_time: str, mentor_id: str = None) -> dict | None:
-        """Modify appointment date/time. If mentor_id provided, validates availability. Preserves mentor_id if not provided."""
-        # If mentor_id provided, check availability
-        if mentor_id:
-            if not self.is_mentor_available(mentor_id, new_date, new_time):
-                return None
-            if self.is_slot_booked(new_date, new_time, mentor_id):
-                return None
-        else:
-            # Check globally if no mentor_id
-            if self.is_slot_booked(new_date, new_time):
-                return None
+    async def modify_appointment(self, phone: str, old_date: str, old_time: str, new_date: str, new_time: str, mentor_id: str = None) -> dict | None:
+        """Move an active appointment to a new date/time, or return None if the
+        new slot is taken (or, when mentor_id is given, outside the mentor's
+        availability). Preserves the existing mentor_id if none is provided.
         
-        def from_db():
-            # First get the appointment to preserve mentor_id
-            old_apt = self.client.table("appointments").select("*").eq("contact_number", phone).eq("date", old_date).eq("time", old_time).in_("status", ["pending", "booked"]).execute()
-            if not old_apt.data:
-                return None
-            
-            existing_mentor_id = old_apt.data[0].get("mentor_id")
-            # Use provided mentor_id or preserve existing one
-            final_mentor_id = mentor_id if mentor_id else existing_mentor_id
-            
-            # Update with preserved mentor_id
-            update_data = {"date": new_date, "time": new_time, "updated_at": datetime.now().isoformat()}
-            if final_mentor_id:
-                update_data["mentor_id"] = final_mentor_id
-            
-            res = self.client.table("appointments").update(update_data).eq("contact_number", phone).eq("date", old_date).eq("time", old_time).in_("status", ["pending", "booked"]).execute()
+        On Supabase the checks and the update run as one move_appointment
+        call, so no other booking can land between them.
+        """
+        async def from_db():
+            res = await self.client.rpc("move_appointment", {
+                "p_phone": phone,
+                "p_old_date": old_date,
+                "p_old_time": old_time,
+                "p_new_date": new_date,
+                "p_new_time": new_time,
+                "p_mentor_id": mentor_id,
+            }).execute()
             return res.data[0] if res.data else None
         def from_memory():
-            for apt in self._appointments:
-                if apt["contact_number"] == phone and apt["date"] == old_date and apt["time"] == old_time and apt["status"] in ("pending", "booked"):
-                    apt["date"] = new_date
-                    apt["time"] = new_time
-                    # Preserve or set mentor_id
-                    if mentor_id:
-                        apt["mentor_id"] = mentor_id
-                    elif not apt.get("mentor_id"):
-                        # Keep existing mentor_id
-                        pass
-                    return apt
-            return None
-        return self._db(from_db, from_memory)
+            apt = next((
+                a for a in self._appts_by_phone.get(phone, ())
+                if a["date"] == old_date and a["time"] == old_time and a["status"] in ACTIVE_STATUSES
+            ), None)
+            if apt is None:
+                return None
+            if any(
+                a is not apt and (not mentor_id or a.get("mentor_id") == mentor_id)
+                for a in self._slot_index.get((new_date, new_time), ())
+            ):
+                return None
+            changes = {"date": new_date, "time": new_time}
+            # Set mentor_id if provided, otherwise keep the existing one
+            if mentor_id:
+                changes["mentor_id"] = mentor_id
+            self._update_memory_appointment(apt, changes)
+            return apt
+        result = await self._db(from_db, from_memory)
+        self._stats_cache.clear()
+        self._forget_appointments(phone)
+        return result
     
-    def get_mentor_appointments(self, mentor_id: str, status: str = None, start_date: str = None, end_date: str = None) -> list:
-        def from_db():
-            q = self.client.table("appointments").select("*, users(name, contact_number)").eq("mentor_id", mentor_id)
+    async def get_mentor_appointments(self, mentor_id: str, status: str = None, start_date: str = None, end_date: str = None) -> list:
+        async def from_db():
+            q = self.client.table("appointments_full").select(_APPOINTMENT_LIST_SELECT).eq("mentor_id", mentor_id)
             if status:
                 q = q.eq("status", status)
             if start_date:
                 q = q.gte("date", start_date)
             if end_date:
                 q = q.lte("date", end_date)
-            return q.order("date").order("time").execute().data or []
+            return (await q.order("date").order("time").execute()).data or []
         def from_memory():
-            apts = [a for a in self._appointments if a.get("mentor_id") == mentor_id]
-            if status:
-                apts = [a for a in apts if a["status"] == status]
-            if start_date:
-                apts = [a for a in apts if a["date"] >= start_date]
-            if end_date:
-                apts = [a for a in apts if a["date"] <= end_date]
-            return apts
-        return self._db(from_db, from_memory)
+            return _filter_appointments(self._appts_by_mentor.get(mentor_id, ()), status, start_date=start_date, end_date=end_date)
+        return await self._db(from_db, from_memory)
     
-    def list_all_appointments(self, status: str = None, mentor_id: str = None) -> list:
-        def from_db():
-            q = self.client.table("appointments").select("*, users(name), mentors(name)")
+    async def list_all_appointments(self, status: str = None, mentor_id: str = None, start_date: str = None, end_date: str = None,
+                                    cursor: str = None, limit: int = None) -> list:
+        """Appointments, latest date first. With a limit, pages by keyset on
+        (date, id); pass next_cursor() of a page to get the next one."""
+        async def from_db():
+            q = self.client.table("appointments_full").select(_APPOINTMENT_LIST_SELECT)
             if status:
                 q = q.eq("status", status)
             if mentor_id:
                 q = q.eq("mentor_id", mentor_id)
-            return q.order("date", desc=True).execute().data or []
+            if start_date:
+                q = q.gte("date", start_date)
+            if end_date:
+                q = q.lte("date", end_date)
+            q = _keyset(q, "date", cursor, limit) if limit else q.order("date", desc=True)
+            return (await q.execute()).data or []
         def from_memory():
-            apts = self._appointments.copy()
-            if status:
-                apts = [a for a in apts if a["status"] == status]
-            if mentor_id:
-                apts = [a for a in apts if a.get("mentor_id") == mentor_id]
-            return apts
-        return self._db(from_db, from_memory)
+            source = self._appts_by_mentor.get(mentor_id, ()) if mentor_id else self._appointments
+            apts = _filter_appointments(source, status, start_date=start_date, end_date=end_date)
+            return _keyset_memory(apts, "date", cursor, limit) if limit else apts
+        return await self._db(from_db, from_memory)
     
     # ==================== SESSIONS ====================
     
-    def create_session(self, room_name: str, contact_number: str = None) -> dict:
-        data = {"room_name": room_name, "contact_number": contact_number, "started_at": datetime.now().isoformat(), "status": "active"}
-        def from_db():
-            return self.client.table("sessions").insert(data).execute().data[0]
+    async def create_session(self, room_name: str, contact_number: str = None) -> dict:
+        data = {"room_name": room_name, "contact_number": contact_number, "started_at": _now_iso(), "status": "active"}
+        async def from_db():
+            return (await self.client.table("sessions").insert(data).execute()).data[0]
         def from_memory():
             sid = f"session_{len(self._sessions) + 1}"
             data["id"] = sid
             self._sessions[sid] = data
+            self._active_sessions[sid] = _parse_ts(data["started_at"])
             return data
-        return self._db(from_db, from_memory)
+        result = await self._db(from_db, from_memory)
+        self._stats_cache.clear()
+        return result
     
-    def get_session(self, session_id: str) -> dict | None:
-        def from_db():
-            res = self.client.table("sessions").select("*").eq("id", session_id).execute()
+    async def get_session(self, session_id: str) -> dict | None:
+        async def from_db():
+            res = await self.client.table("sessions").select("*").eq("id", session_id).execute()
             return res.data[0] if res.data else None
-        return self._db(from_db, lambda: self._sessions.get(session_id))
+        return await self._db(from_db, lambda: self._sessions.get(session_id))
     
-    def update_session(self, session_id: str, **kwargs) -> None:
-        def from_db():
-            self.client.table("sessions").update(kwargs).eq("id", session_id).execute()
+    async def update_session(self, session_id: str, **kwargs) -> None:
+        async def from_db():
+            # Nothing is read back, so don't have PostgREST echo the row
+            await self.client.table("sessions").update(kwargs, returning="minimal").eq("id", session_id).execute()
         def from_memory():
             if session_id in self._sessions:
-                self._sessions[session_id].update(kwargs)
-        self._db(from_db, from_memory)
-    
-    def link_session_to_user(self, session_id: str, phone: str) -> None:
-        user = self.get_or_create_user(phone)
-        self.update_session(session_id, contact_number=phone, user_id=user.get("id"))
-    
-    def log_cost(self, session_id: str, service: str, units: float, unit_type: str, cost_usd: float) -> None:
-        """Log cost to cost_logs table."""
-        data = {
-            "session_id": session_id,
-            "service": service,
-            "units": float(units),  # Ensure it's a float
-            "unit_type": unit_type,
-            "cost_usd": float(cost_usd),  # Ensure it's a float
-        }
-        def from_db():
-            try:
-                result = self.client.table("cost_logs").insert(data).execute()
-                logger.info(f"Logged cost: {service} = ${cost_usd:.6f} ({units} {unit_type})")
-            except Exception as e:
-                logger.error(f"Could not log cost: {e}, data: {data}")
-        def from_memory():
-            pass  # In-memory doesn't track costs
-        self._db(from_db, from_memory)
+                self._update_memory_session(self._sessions[session_id], kwargs)
+        await self._db(from_db, from_memory)
+        self._stats_cache.clear()
     
-    def cleanup_abandoned_sessions(self, timeout_minutes: int = 30) -> int:
-        """Mark sessions as abandoned if they've been active for more than timeout_minutes."""
-        cutoff_time = (datetime.now() - timedelta(minutes=timeout_minutes)).isoformat()
-        def from_db():
+    async def link_session_to_user(self, session_id: str, phone: str) -> None:
+        user = await self.get_or_create_user(phone)
+        await self.update_session(session_id, contact_number=phone, user_id=user.get("id"))
+    
+    async def cleanup_abandoned_sessions(self, timeout_minutes: int = 30) -> int:
+        """Mark sessions as abandoned if they've been active for more than timeout_minutes.
+        
+        On Supabase the abandon_stale_sessions SQL function computes the
+        cutoff from the database clock (served by idx_sessions_active_started).
+        """
+        async def from_db():
             try:
-                res = self.client.table("sessions").update({"status": "abandoned"}).eq("status", "active").lt("started_at", cutoff_time).execute()
-                return len(res.data) if res.data else 0
+                res = await self.client.rpc("abandon_stale_sessions", {"p_timeout_minutes": timeout_minutes}).execute()
+                return res.data or 0
             except Exception as e:
                 logger.error(f"Failed to cleanup sessions: {e}")
                 return 0
         def from_memory():
-            count = 0
-            for sid, session in self._sessions.items():
-                if session.get("status") == "active":
-                    started = session.get("started_at")
-                    if started:
-                        try:
-                            started_dt = datetime.fromisoformat(started.replace("Z", "+00:00"))
-                            if (datetime.now() - started_dt.replace(tzinfo=None)).total_seconds() > timeout_minutes * 60:
-                                session["status"] = "abandoned"
-                                count += 1
-                        except:
-                            pass
-            return count
-        return self._db(from_db, from_memory)
-    
-    def end_session(self, session_id: str, contact_number: str = None, summary: str = None, cost_breakdown: dict = None) -> None:
-        update = {"ended_at": datetime.now().isoformat(), "status": "completed"}
-        if contact_number:
-            update["contact_number"] = contact_number
-        if summary:
-            update["summary"] = summary
-        if cost_breakdown:
-            update["cost_breakdown"] = cost_breakdown
-            
-            # Log individual costs to cost_logs (always log, even if 0)
-            breakdown = cost_breakdown.get("breakdown", {})
-            
-            # STT
-            stt_minutes = breakdown.get("stt_minutes", 0)
-            self.log_cost(
-                session_id, "deepgram_stt",
-                stt_minutes,
-                "minutes",
-                cost_breakdown.get("stt", 0)
-            )
-            
-            # TTS
-            tts_characters = breakdown.get("tts_characters", 0)
-            self.log_cost(
-                session_id, "cartesia_tts",
-                tts_characters,
-                "characters",
-                cost_breakdown.get("tts", 0)
-            )
-            
-            # LLM
-            llm_total_tokens = breakdown.get("llm_total_tokens", 0)
-            self.log_cost(
-                session_id, "openai_llm",
-                llm_total_tokens,
-                "tokens",
-                cost_breakdown.get("llm", 0)
-            )
-        
-        session = self.get_session(session_id)
-        if session and session.get("started_at"):
-            try:
-                started = datetime.fromisoformat(session["started_at"].replace("Z", "+00:00"))
-                update["duration_seconds"] = int((datetime.now() - started).total_seconds())
-            except:
-                pass
+            # Only active sessions are scanned, against start times parsed once
+            # when they became active
+            cutoff = datetime.now(timezone.utc) - timedelta(minutes=timeout_minutes)
+            stale = [sid for sid, started in self._active_sessions.items() if started < cutoff]
+            for sid in stale:
+                self._update_memory_session(self._sessions[sid], {"status": "abandoned"})
+            return len(stale)
+        count = await self._db(from_db, from_memory)
+        if count:
+            self._stats_cache.clear()
+        return count
+    
+    async def end_session(self, session_id: str, contact_number: str = None, summary: str = None, cost_breakdown: dict = None) -> None:
+        """Close a session and log its costs.
         
-        self.update_session(session_id, **update)
+        The end_session SQL function stamps ended_at, computes duration from
+        the database clock and writes the cost_logs rows in one round trip.
+        """
+        async def from_db():
+            await self.client.rpc("end_session", {
+                "p_id": session_id,
+                "p_contact_number": contact_number or None,
+                "p_summary": summary or None,
+                "p_cost": cost_breakdown or None,
+            }).execute()
+        def from_memory():
+            session = self._sessions.get(session_id)
+            if not session:
+                return
+            update = {"ended_at": _now_iso(), "status": "completed"}
+            if contact_number:
+                update["contact_number"] = contact_number
+            if summary:
+                update["summary"] = summary
+            if cost_breakdown:
+                update["cost_breakdown"] = cost_breakdown
+                # Mirrors the generated sessions.cost column
+                update["cost"] = cost_breakdown.get("total", 0)
+            if session.get("started_at"):
+                started = _parse_ts(session["started_at"])
+                update["duration_seconds"] = int((_parse_ts(update["ended_at"]) - started).total_seconds())
+            self._update_memory_session(session, update)
+        await self._db(from_db, from_memory)
+        self._stats_cache.clear()
     
-    def add_message(self, session_id: str, role: str, content: str, tool_name: str = None, tool_args: dict = None, tool_result: dict = None) -> dict:
-        data = {"session_id": session_id, "role": role, "content": content, "tool_name": tool_name, "tool_args": tool_args, "tool_result": tool_result, "timestamp": datetime.now().isoformat()}
-        def from_db():
-            return self.client.table("session_messages").insert(data).execute().data[0]
+    async def add_message(self, session_id: str, role: str, content: str, tool_name: str = None, tool_args: dict = None, tool_result: dict = None) -> dict:
+        data = {"session_id": session_id, "role": role, "content": content, "tool_name": tool_name, "tool_args": tool_args, "tool_result": tool_result, "timestamp": _now_iso()}
+        async def from_db():
+            return (await self.client.table("session_messages").insert(data).execute()).data[0]
         def from_memory():
             data["id"] = f"msg_{len(self._messages) + 1}"
             self._messages.append(data)
+            self._messages_by_session.setdefault(session_id, []).append(data)
             return data
-        return self._db(from_db, from_memory)
+        return await self._db(from_db, from_memory)
     
-    def get_session_messages(self, session_id: str) -> list:
-        def from_db():
-            return self.client.table("session_messages").select("*").eq("session_id", session_id).order("timestamp").execute().data or []
-        return self._db(from_db, lambda: [m for m in self._messages if m["session_id"] == session_id])
+    async def get_session_messages(self, session_id: str) -> list:
+        async def from_db():
+            return (await self.client.table("session_messages").select("*").eq("session_id", session_id).order("timestamp").execute()).data or []
+        return await self._db(from_db, lambda: list(self._messages_by_session.get(session_id, ())))
     
-    def get_user_sessions(self, phone: str, limit: int = 50) -> list:
-        def from_db():
-            return self.client.table("sessions").select("*").eq("contact_number", phone).order("started_at", desc=True).limit(limit).execute().data or []
+    async def get_user_sessions(self, phone: str, limit: int = 50) -> list:
+        async def from_db():
+            return (await self.client.table("sessions").select(_SESSION_LIST_SELECT).eq("contact_number", phone).order("started_at", desc=True).limit(limit).execute()).data or []
         def from_memory():
-            sessions = [s for s in self._sessions.values() if s.get("contact_number") == phone]
-            return sorted(sessions, key=lambda x: x.get("started_at", ""), reverse=True)[:limit]
-        return self._db(from_db, from_memory)
+            sessions = (s for s in self._sessions.values() if s.get("contact_number") == phone)
+            return heapq.nlargest(limit, sessions, key=itemgetter("started_at"))
+        return await self._db(from_db, from_memory)
     
-    def list_all_sessions(self, status: str = None, skip: int = 0, limit: int = 50) -> list:
-        def from_db():
-            q = self.client.table("sessions").select("*, users(name)")
+    async def list_all_sessions(self, status: str = None, cursor: str = None, limit: int = 50) -> list:
+        """Newest sessions first; pass next_cursor() of a page to get the next one."""
+        async def from_db():
+            q = self.client.table("sessions").select(f"{_SESSION_LIST_SELECT}, users(name)")
             if status:
                 q = q.eq("status", status)
-            return q.order("started_at", desc=True).range(skip, skip + limit - 1).execute().data or []
+            return (await _keyset(q, "started_at", cursor, limit).execute()).data or []
         def from_memory():
-            sessions = list(self._sessions.values())
+            sessions = self._sessions.values()
             if status:
-                sessions = [s for s in sessions if s.get("status") == status]
-            return sorted(sessions, key=lambda x: x.get("started_at", ""), reverse=True)[skip:skip + limit]
-        return self._db(from_db, from_memory)
+                sessions = (s for s in sessions if s.get("status") == status)
+            return _keyset_memory(sessions, "started_at", cursor, limit)
+        return await self._db(from_db, from_memory)
     
     # ==================== CONTEXT ====================
     
-    def get_user_context(self, phone: str) -> dict:
+    async def get_user_context(self, phone: str) -> dict:
         """Get comprehensive context for a user."""
-        user = self.get_or_create_user(phone)
-        booked = self.get_user_appointments(phone, status=["booked"])
-        pending = self.get_user_appointments(phone, status=["pending"])
-        sessions = self.get_user_sessions(phone, limit=5)
+        user, appointments, sessions = await asyncio.gather(
+            self.get_or_create_user(phone),
+            self.get_user_appointments(phone, cached=True),
+            self.get_user_sessions(phone, limit=5),
+        )
         last = sessions[0] if sessions else None
         
+        # One query for every status, partitioned here (rows stay date/time ordered)
+        buckets = {"booked": [], "pending": [], "completed": [], "cancelled": []}
+        for apt in appointments:
+            bucket = buckets.get(apt.get("status"))
+            if bucket is not None:
+                bucket.append(apt)
+        
         return {
             "user": user,
             "is_returning": len(sessions) > 0,
             "total_sessions": len(sessions),
-            "appointments": {"booked": booked, "pending": pending},
+            "appointments": {"booked": buckets["booked"], "pending": buckets["pending"]},
+            "completed_count": len(buckets["completed"]),
+            "cancelled_count": len(buckets["cancelled"]),
             "last_session": {"date": last.get("started_at") if last else None, "summary": last.get("summary") if last else None},
         }
     
     # ==================== ADMIN ====================
     
-    def get_admin_by_email(self, email: str) -> dict | None:
-        def from_db():
-            res = self.client.table("admins").select("*").eq("email", email).execute()
+    async def get_admin_by_email(self, email: str) -> dict | None:
+        async def from_db():
+            res = await self.client.table("admins").select("*").eq("email", email).execute()
             return res.data[0] if res.data else None
         def from_memory():
             # Default admin for testing
             if email == "admin@superbryn.com":
                 return {"id": "1", "email": email, "password_hash": "$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/X4.qVYHJqI/4p4J1C", "role": "admin"}
             return None
-        return self._db(from_db, from_memory)
+        return await self._cached(self._admin_cache, ("email", email), from_db, from_memory)
     
-    def get_admin_stats(self) -> dict:
-        """Get admin dashboard statistics."""
-        return {
-            "total_users": len(self._users) if not self._enabled else len(self.list_users()),
-            "total_mentors": len(self.get_mentors()),
-            "total_sessions": len(self._sessions) if not self._enabled else len(self.list_all_sessions()),
-            "total_appointments": len(self._appointments) if not self._enabled else len(self.list_all_appointments()),
-        }
+    async def get_admin_stats(self) -> dict:
+        """Get admin dashboard statistics (single get_admin_stats() RPC)."""
+        async def from_db():
+            res = await self.client.rpc("get_admin_stats").execute()
+            return res.data[0] if res.data else {}
+        def from_memory():
+            # Session and appointment figures come from the running aggregates
+            return {
+                "total_users": len(self._users) - len(self._inactive_users),
+                "total_mentors": sum(1 for m in self._mentors.values() if m.get("is_active")),
+                "total_sessions": len(self._sessions),
+                "active_sessions": len(self._active_sessions),
+                "total_appointments": len(self._appointments),
+                "pending_appointments": self._appt_status_counts["pending"],
+                "completed_appointments": self._appt_status_counts["completed"],
+                "total_cost": self._session_cost_total,
+            }
+        return await self._cached(self._stats_cache, "admin_stats", from_db, from_memory)
     
     # ==================== MENTOR AVAILABILITY ====================
     
-    def get_mentor_availability(self, mentor_id: str, start_date: str = None, end_date: str = None) -> list:
-        def from_db():
+    async def get_mentor_availability(self, mentor_id: str, start_date: str = None, end_date: str = None) -> list:
+        async def from_db():
             q = self.client.table("mentor_availability").select("*").eq("mentor_id", mentor_id)
             if start_date:
                 q = q.gte("date", start_date)
             if end_date:
                 q = q.lte("date", end_date)
-            return q.order("date").execute().data or []
+            return (await q.order("date").execute()).data or []
         def from_memory():
-            avail = [a for a in self._availability if a.get("mentor_id") == mentor_id]
+            avail = list(self._avail_by_mentor.get(mentor_id, ()))
             if start_date:
                 avail = [a for a in avail if a.get("date") >= start_date]
             if end_date:
                 avail = [a for a in avail if a.get("date") <= end_date]
             return avail
-        return self._db(from_db, from_memory)
+        return await self._db(from_db, from_memory)
     
-    def add_mentor_availability(self, mentor_id: str, date_str: str, start_time: str, end_time: str, slot_duration: int = 60) -> dict:
+    async def add_mentor_availability(self, mentor_id: str, date_str: str, start_time: str, end_time: str, slot_duration: int = 60) -> dict:
         data = {"mentor_id": mentor_id, "date": date_str, "start_time": start_time, "end_time": end_time, "slot_duration_minutes": slot_duration, "is_available": True}
-        def from_db():
-            return self.client.table("mentor_availability").insert(data).execute().data[0]
+        async def from_db():
+            return (await self.client.table("mentor_availability").insert(data).execute()).data[0]
         def from_memory():
-            data["id"] = f"avail_{len(self._availability) + 1}"
-            self._availability.append(data)
+            data["id"] = f"avail_{self._next_avail_id}"
+            self._next_avail_id += 1
+            self._avail_by_id[data["id"]] = data
+            self._avail_by_mentor.setdefault(mentor_id, []).append(data)
             return data
-        return self._db(from_db, from_memory)
+        return await self._db(from_db, from_memory)
     
-    def remove_mentor_availability(self, availability_id: str) -> bool:
-        def from_db():
-            res = self.client.table("mentor_availability").delete().eq("id", availability_id).execute()
-            return bool(res.data)
+    async def remove_mentor_availability(self, availability_id: str) -> bool:
+        async def from_db():
+            res = await self.client.table("mentor_availability").delete(**_COUNT_ONLY).eq("id", availability_id).execute()
+            return bool(res.count)
         def from_memory():
-            self._availability = [a for a in self._availability if a.get("id") != availability_id]
+            avail = self._avail_by_id.pop(availability_id, None)
+            if avail is None:
+                return False
+            mentor_avail = self._avail_by_mentor.get(avail["mentor_id"], [])
+            self._avail_by_mentor[avail["mentor_id"]] = [a for a in mentor_avail if a is not avail]
             return True
-        return self._db(from_db, from_memory)
+        return await self._db(from_db, from_memory)
     
-    def get_available_slots_for_mentor(self, mentor_id: str, date_str: str) -> list:
-        """Get available time slots for a mentor on a date."""
-        avails = self.get_mentor_availability(mentor_id, start_date=date_str, end_date=date_str)
+    async def get_available_slots_for_mentor(self, mentor_id: str, date_str: str) -> list:
+        """Get available time slots for a mentor on a date.
+        
+        On Supabase the get_mentor_available_slots SQL function builds the
+        slot grid and its booked flags in one query; otherwise (or if Supabase
+        is unreachable) the slots are composed from availability and booked times.
+        """
+        if self._circuit_allows():
+            try:
+                res = await self.client.rpc("get_mentor_available_slots", {"p_mentor_id": mentor_id, "p_date": date_str}).execute()
+            except Exception as e:
+                self._record_db_result(e)
+                if not isinstance(e, httpx.TransportError):
+                    raise
+            else:
+                self._record_db_result(None)
+                # TIME columns come back as HH:MM:SS
+                return [
+                    {"time": r["slot_time"][:5], "is_booked": r["is_booked"], "available": not r["is_booked"]}
+                    for r in res.data or []
+                ]
+        
+        avails = await self.get_mentor_availability(mentor_id, start_date=date_str, end_date=date_str)
         if not avails:
             return []
         
         avail = avails[0]
-        start = datetime.strptime(avail["start_time"], "%H:%M")
-        end = datetime.strptime(avail["end_time"], "%H:%M")
-        duration = avail.get("slot_duration_minutes", 60)
-        
-        slots = []
-        current = start
-        while current < end:
-            time_str = current.strftime("%H:%M")
-            is_booked = self.is_slot_booked(date_str, time_str, mentor_id)
-            slots.append({"time": time_str, "is_booked": is_booked, "available": not is_booked})
-            current += timedelta(minutes=duration)
-        return slots
-    
-    def update_mentor(self, mentor_id: str, **kwargs) -> dict:
-        kwargs["updated_at"] = datetime.now().isoformat()
-        def from_db():
-            res = self.client.table("mentors").update(kwargs).eq("id", mentor_id).execute()
+        booked = await self.get_booked_times(mentor_id, date_str)
+        return [
+            {"time": t, "is_booked": t in booked, "available": t not in booked}
+            for t in slot_times(avail["start_time"], avail["end_time"], avail.get("slot_duration_minutes", 60))
+        ]
+    
+    async def update_mentor(self, mentor_id: str, **kwargs) -> dict:
+        # updated_at is set by the mentors_updated_at trigger on Supabase
+        async def from_db():
+            res = await self.client.table("mentors").update(kwargs).eq("id", mentor_id).execute()
             m = res.data[0] if res.data else {}
             m.pop("password_hash", None)
             return m
         def from_memory():
             if mentor_id in self._mentors:
-                self._mentors[mentor_id].update(kwargs)
-                return {k: v for k, v in self._mentors[mentor_id].items() if k != "password_hash"}
+                self._mentors[mentor_id].update(kwargs, updated_at=_now_iso())
+                return _public_mentor(self._mentors[mentor_id])
             return {}
-        return self._db(from_db, from_memory)
+        result = await self._db(from_db, from_memory)
+        self._mentor_cache.clear()
+        self._stats_cache.clear()
+        return result
     
-    def delete_mentor(self, mentor_id: str) -> bool:
-        def from_db():
-            return bool(self.client.table("mentors").delete().eq("id", mentor_id).execute().data)
+    async def delete_mentor(self, mentor_id: str) -> bool:
+        async def from_db():
+            return bool((await self.client.table("mentors").delete(**_COUNT_ONLY).eq("id", mentor_id).execute()).count)
         def from_memory():
             if mentor_id in self._mentors:
                 del self._mentors[mentor_id]
                 return True
             return False
-        return self._db(from_db, from_memory)
+        result = await self._db(from_db, from_memory)
+        self._mentor_cache.clear()
+        self._stats_cache.clear()
+        return result
     
-    def delete_user(self, phone: str) -> bool:
-        def from_db():
-            return bool(self.client.table("users").delete().eq("contact_number", phone).execute().data)
+    async def delete_user(self, phone: str) -> bool:
+        async def from_db():
+            return bool((await self.client.table("users").delete(**_COUNT_ONLY).eq("contact_number", phone).execute()).count)
         def from_memory():
             if phone in self._users:
                 del self._users[phone]
+                self._inactive_users.discard(phone)
                 return True
             return False
-        return self._db(from_db, from_memory)
+        result = await self._db(from_db, from_memory)
+        self._user_cache.pop(phone, None)
+        self._stats_cache.clear()
+        return result
     
-    def get_appointment_by_id(self, appointment_id: str) -> dict | None:
-        def from_db():
-            res = self.client.table("appointments").select("*, users(name), mentors(name)").eq("id", appointment_id).execute()
+    async def get_appointment_by_id(self, appointment_id: str) -> dict | None:
+        async def from_db():
+            res = await self.client.table("appointments_full").select("*").eq("id", appointment_id).execute()
             return res.data[0] if res.data else None
         def from_memory():
-            return next((a for a in self._appointments if a.get("id") == appointment_id), None)
-        return self._db(from_db, from_memory)
+            return self._appts_by_id.get(appointment_id)
+        return await self._db(from_db, from_memory)
     
-    def update_appointment(self, appointment_id: str, **kwargs) -> dict:
-        kwargs["updated_at"] = datetime.now().isoformat()
-        def from_db():
-            res = self.client.table("appointments").update(kwargs).eq("id", appointment_id).execute()
+    async def update_appointment(self, appointment_id: str, **kwargs) -> dict:
+        # updated_at is set by the appointments_updated_at trigger on Supabase
+        async def from_db():
+            res = await self.client.table("appointments").update(kwargs).eq("id", appointment_id).execute()
             return res.data[0] if res.data else {}
         def from_memory():
-            for apt in self._appointments:
-                if apt.get("id") == appointment_id:
-                    apt.update(kwargs)
-                    return apt
-            return {}
-        return self._db(from_db, from_memory)
+            apt = self._appts_by_id.get(appointment_id)
+            if not apt:
+                return {}
+            self._update_memory_appointment(apt, {**kwargs, "updated_at": _now_iso()})
+            return apt
+        result = await self._db(from_db, from_memory)
+        self._stats_cache.clear()
+        self._forget_appointments(result.get("contact_number") if result else None)
+        return result
     
-    def get_mentor_calendar(self, mentor_id: str, year: int, month: int) -> dict:
+    async def get_mentor_calendar(self, mentor_id: str, year: int, month: int) -> dict:
         """Get calendar view for a mentor."""
         start_date = f"{year}-{month:02d}-01"
         end_date = f"{year}-{month + 1:02d}-01" if month < 12 else f"{year + 1}-01-01"
         
-        appointments = self.get_mentor_appointments(mentor_id, start_date=start_date, end_date=end_date)
-        availability = self.get_mentor_availability(mentor_id, start_date=start_date, end_date=end_date)
+        # One request: both tables are embedded under the mentor row, each
+        # filtered to [start_date, end_date) and ordered server-side
+        async def from_db():
+            res = await (
+                self.client.table("mentors")
+                .select("id, appointments(*, users(name, contact_number)), mentor_availability(*)")
+                .eq("id", mentor_id)
+                .gte("appointments.date", start_date).lt("appointments.date", end_date)
+                .gte("mentor_availability.date", start_date).lt("mentor_availability.date", end_date)
+                .order("date", foreign_table="appointments").order("time", foreign_table="appointments")
+                .order("date", foreign_table="mentor_availability")
+                .execute()
+            )
+            row = res.data[0] if res.data else {}
+            return row.get("appointments") or [], row.get("mentor_availability") or []
+        def from_memory():
+            apts = [a for a in self._appts_by_mentor.get(mentor_id, ()) if start_date <= a["date"] < end_date]
+            avail = [a for a in self._avail_by_mentor.get(mentor_id, ()) if start_date <= a["date"] < end_date]
+            return sorted(apts, key=lambda x: (x["date"], x["time"])), sorted(avail, key=lambda x: x["date"])
+        appointments, availability = await self._db(from_db, from_memory)
         
         calendar = {}
         for apt in appointments:
@@ -663,28 +1275,79 @@ class Database:
         
         return {"year": year, "month": month, "days": calendar}
     
-    def get_admin_by_id(self, admin_id: str) -> dict | None:
-        def from_db():
-            res = self.client.table("admins").select("id, name, email, role, is_active").eq("id", admin_id).execute()
+    async def get_admin_by_id(self, admin_id: str) -> dict | None:
+        async def from_db():
+            res = await self.client.table("admins").select("id, name, email, role, is_active").eq("id", admin_id).execute()
             return res.data[0] if res.data else None
         def from_memory():
             return {"id": "1", "name": "Admin", "email": "admin@superbryn.com", "role": "admin"}
-        return self._db(from_db, from_memory)
+        return await self._cached(self._admin_cache, admin_id, from_db, from_memory)
     
-    def update_admin_login(self, admin_id: str) -> None:
-        def from_db():
-            self.client.table("admins").update({"last_login": datetime.now().isoformat()}).eq("id", admin_id).execute()
+    async def update_admin_login(self, admin_id: str) -> None:
+        async def from_db():
+            await self.client.table("admins").update({"last_login": _now_iso()}).eq("id", admin_id).execute()
         def from_memory():
             pass
-        self._db(from_db, from_memory)
+        await self._db(from_db, from_memory)
     
-    def get_cost_report(self, start_date: str = None, end_date: str = None, group_by: str = "day") -> list:
-        return []
+    async def get_cost_report(self, start_date: str = None, end_date: str = None, group_by: str = "day") -> list:
+        """Per-service cost totals bucketed by day, week or month.
+        
+        Reads the matching cost_summary_* materialized view, so the report is
+        an index range scan over buckets rather than a GROUP BY over cost_logs.
+        The views are as fresh as their last refresh_cost_summaries() run
+        (every 15 minutes via pg_cron, see schema.sql).
+        """
+        async def from_db():
+            q = self.client.table(_COST_SUMMARY_VIEWS[group_by]).select("*")
+            if start_date:
+                q = q.gte("bucket", start_date)
+            if end_date:
+                q = q.lte("bucket", end_date)
+            return (await q.order("bucket").execute()).data or []
+        # In-memory mode doesn't log costs
+        return await self._cached(self._stats_cache, ("cost_report", start_date, end_date, group_by), from_db, lambda: [])
     
-    def get_session_costs(self, skip: int = 0, limit: int = 50) -> list:
-        def from_db():
-            return self.client.table("sessions").select("id, room_name, contact_number, started_at, ended_at, duration_seconds, summary, cost_breakdown").order("started_at", desc=True).range(skip, skip + limit - 1).execute().data or []
-        def from_memory():
-            sessions = list(self._sessions.values())
-            return sorted(sessions, key=lambda x: x.get("started_at", ""), reverse=True)[skip:skip + limit]
-        return self._db(from_db, from_memory)
+    async def get_session_costs(self, cursor: str = None, limit: int = 50) -> list:
+        """Newest sessions first with costs; pass next_cursor() of a page to get the next one."""
+        async def from_db():
+            # Only what the cost table shows (plus started_at for the cursor);
+            # summaries can be long and are served by /api/sessions instead
+            q = self.client.table("sessions").select("id, contact_number, started_at, cost_breakdown, cost, users(name)")
+            return (await _keyset(q, "started_at", cursor, limit).execute()).data or []
+        return await self._db(from_db, lambda: _keyset_memory(self._sessions.values(), "started_at", cursor, limit))
+    
+    async def iter_session_costs(self, page: int = 500):
+        """Yield every session cost row newest-first, one keyset page at a time,
+        so at most `page` rows are held at once."""
+        cursor = None
+        while True:
+            rows = await self.get_session_costs(cursor=cursor, limit=page)
+            for row in rows:
+                yield row
+            cursor = next_cursor(rows, "started_at", page)
+            if cursor is None:
+                return
+    
+    async def get_admin_dashboard(self, start_date: str = None, end_date: str = None, limit: int = 50) -> dict:
+        """Admin stats, daily cost report and latest session costs together.
+        
+        One get_admin_dashboard() RPC on Supabase instead of three requests;
+        in memory the three reads are combined directly.
+        """
+        if self._circuit_allows():
+            try:
+                res = await self.client.rpc("get_admin_dashboard", {"p_start": start_date, "p_end": end_date, "p_limit": limit}).execute()
+            except Exception as e:
+                self._record_db_result(e)
+                if not isinstance(e, httpx.TransportError):
+                    raise
+            else:
+                self._record_db_result(None)
+                return res.data
+        stats, costs, sessions = await asyncio.gather(
+            self.get_admin_stats(),
+            self.get_cost_report(start_date, end_date),
+            self.get_session_costs(limit=limit),
+        )
+        return {"stats": stats, "costs": costs, "sessions": sessions}
@@ -12,22 +12,15 @@ Features:
 
 Run: python backend/main.py start
 """
-import os
-import json
+import re
 import logging
 import asyncio
 from datetime import datetime, timedelta
 from typing import Annotated, Any
-from dotenv import load_dotenv
-from pathlib import Path
 
-# Load .env from project root
-env_path = Path(__file__).parent.parent / ".env"
-if env_path.exists():
-    load_dotenv(env_path)
-else:
-    load_dotenv(Path(__file__).parent / ".env")
-    load_dotenv()
+import orjson
+
+import settings
 
 from livekit import rtc
 from livekit.agents import (
@@ -35,6 +28,7 @@ from livekit.agents import (
     AgentSession,
     AutoSubscribe,
     JobContext,
+    JobProcess,
     RunContext,
     WorkerOptions,
     cli,
@@ -44,12 +38,28 @@ from livekit.agents import metrics
 from livekit.agents.metrics import UsageCollector
 from livekit.plugins import cartesia, deepgram, openai, silero, bey
 
-from db import Database
+from db import ACTIVE_STATUSES, Database, slot_times
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("voice-agent")
 
-BEY_AVATAR_ID = os.getenv("BEY_AVATAR_ID", "1c7a7291-ee28-4800-8f34-acfbfc2d07c0")
+BEY_AVATAR_ID = settings.BEY_AVATAR_ID
+
+_NON_DIGIT = re.compile(r"\D")
+
+# Fire-and-forget tasks from event handlers. The loop only keeps weak
+# references to tasks, so they are held here until they finish
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _spawn(loop: asyncio.AbstractEventLoop, coro) -> None:
+    """Run coro on loop in the background, keeping a reference until it completes."""
+    task = loop.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+# Day offsets covered by fetch_slots, built once rather than per call
+_SLOT_WINDOW = tuple(timedelta(days=i) for i in range(5))
 
 # Cost estimates per provider
 COST_PER_UNIT = {
@@ -158,12 +168,14 @@ class VoiceAgent(Agent):
     async def send_to_frontend(self, event_type: str, data: dict):
         """Send data to frontend via LiveKit data channel."""
         try:
-            payload = json.dumps({
+            # orjson encodes straight to UTF-8 bytes; tool payloads can carry
+            # whole mentor/appointment lists
+            payload = orjson.dumps({
                 "type": event_type,
                 "timestamp": datetime.now().isoformat(),
                 "session_id": self.session_id,
                 **data
-            }).encode()
+            })
             await self.room.local_participant.publish_data(payload, reliable=True, topic="agent_events")
             logger.debug(f"Sent to frontend: {event_type}")
         except Exception as e:
@@ -209,42 +221,45 @@ class VoiceAgent(Agent):
         }
     
     
-    def _load_user_context(self, phone: str) -> dict:
-        self.user_context = self.db.get_user_context(phone)
+    async def _load_user_context(self, phone: str) -> dict:
+        self.user_context = await self.db.get_user_context(phone)
         return self.user_context
     
     def _build_context_aware_response(self, context: dict) -> str:
-        user = context.get("user", {})
-        name = user.get("name", "there")
-        is_returning = context.get("is_returning", False)
-        booked = context.get("appointments", {}).get("booked", [])
-        pending = context.get("appointments", {}).get("pending", [])
-        last_summary = context.get("last_session", {}).get("summary")
-        
-        if not is_returning:
+        name = (context.get("user") or {}).get("name", "there")
+        # New users get the fixed greeting without touching the rest of the context
+        if not context.get("is_returning"):
             return f"Hello {name}! I've registered your phone number. How can I help you today? Would you like to book an appointment?"
         
-        parts = [f"Welcome back, {name}!"]
-        if booked:
-            if len(booked) == 1:
-                apt = booked[0]
-                mentor_name = apt.get("mentors", {}).get("name", "a consultant") if isinstance(apt.get("mentors"), dict) else "a consultant"
-                parts.append(f"You have an appointment on {apt['date']} at {apt['time']} with {mentor_name}.")
-            else:
-                parts.append(f"You have {len(booked)} upcoming appointments.")
-        if pending:
-            parts.append(f"You also have {len(pending)} pending appointment(s) to confirm.")
-        if last_summary and not booked and not pending:
-            parts.append(f"Last time we spoke, {last_summary.lower()}")
-        parts.append("How can I help you today?")
-        return " ".join(parts)
+        appointments = context.get("appointments") or {}
+        booked = appointments.get("booked") or ()
+        pending = appointments.get("pending") or ()
+        last_summary = (context.get("last_session") or {}).get("summary")
+        
+        if len(booked) == 1:
+            apt = booked[0]
+            mentor = apt.get("mentors")
+            mentor_name = mentor.get("name", "a consultant") if isinstance(mentor, dict) else "a consultant"
+            booked_line = f"You have an appointment on {apt['date']} at {apt['time']} with {mentor_name}."
+        elif booked:
+            booked_line = f"You have {len(booked)} upcoming appointments."
+        else:
+            booked_line = None
+        
+        return " ".join(filter(None, (
+            f"Welcome back, {name}!",
+            booked_line,
+            f"You also have {len(pending)} pending appointment(s) to confirm." if pending else None,
+            f"Last time we spoke, {last_summary.lower()}" if last_summary and not booked and not pending else None,
+            "How can I help you today?",
+        )))
     
     # ==================== TOOLS ====================
     
     @function_tool()
     async def list_mentors(self, context: RunContext) -> str:
         """List all available mentors with their specialties and IDs."""
-        mentors = self.db.get_mentors(active_only=True)
+        mentors = await self.db.get_mentors(active_only=True)
         if not mentors:
             return "Sorry, no mentors are available at the moment."
         
@@ -256,15 +271,17 @@ class VoiceAgent(Agent):
             # Format: "1. Dr. Sarah Smith - General Consultation"
             mentor_list_voice.append(f"{i}. {name} - {specialty}")
         
-        self.db.add_message(self.session_id, "tool", f"Listed {len(mentors)} mentors", 
-                           tool_name="list_mentors", tool_args={}, 
-                           tool_result={"count": len(mentors), "mentors": mentors})
-        
-        await self.send_to_frontend("tool_call", {
-            "tool": "list_mentors",
-            "args": {},
-            "result": {"mentors": mentors}
-        })
+        # The transcript log write and the frontend event don't depend on each other
+        await asyncio.gather(
+            self.db.add_message(self.session_id, "tool", f"Listed {len(mentors)} mentors",
+                                tool_name="list_mentors", tool_args={},
+                                tool_result={"count": len(mentors), "mentors": mentors}),
+            self.send_to_frontend("tool_call", {
+                "tool": "list_mentors",
+                "args": {},
+                "result": {"mentors": mentors}
+            }),
+        )
         
         mentor_text = "\n".join(mentor_list_voice)
         return f"Here are our available mentors:\n{mentor_text}\n\nWhich mentor would you like to book with? Please tell me the mentor's name."
@@ -277,24 +294,22 @@ class VoiceAgent(Agent):
         name: Annotated[str | None, "User's name if provided"] = None,
     ) -> str:
         """Identify and register a user by their phone number."""
-        phone = "".join(filter(str.isdigit, phone_number))
-        if len(phone) == 10:
-            phone = f"+1{phone}"
-        elif not phone.startswith("+"):
-            phone = f"+{phone}"
+        phone = _NON_DIGIT.sub("", phone_number)
+        phone = f"+1{phone}" if len(phone) == 10 else f"+{phone}"
         
-        user = self.db.get_or_create_user(phone, name or "User")
+        user = await self.db.get_or_create_user(phone, name or "User")
         self.user_phone = phone
         self.user_name = user.get("name", "User")
         
+        # Renaming the user and linking the session are independent writes
+        writes = [self.db.link_session_to_user(self.session_id, phone)]
         if name and name != user.get("name"):
-            self.db.update_user(phone, name=name)
+            writes.append(self.db.update_user(phone, name=name))
             self.user_name = name
+        await asyncio.gather(*writes)
+        user_context = await self._load_user_context(phone)
         
-        self.db.link_session_to_user(self.session_id, phone)
-        user_context = self._load_user_context(phone)
-        
-        self.db.add_message(
+        await self.db.add_message(
             self.session_id, "tool", f"Identified user: {phone}",
             tool_name="identify_user",
             tool_args={"phone_number": phone_number, "name": name},
@@ -328,7 +343,7 @@ class VoiceAgent(Agent):
         """Fetch available appointment slots for a specific mentor. Provide either mentor_id (from list_mentors) or mentor_name."""
         # If mentor_name provided, find the mentor_id
         if mentor_name and not mentor_id:
-            mentors = self.db.get_mentors(active_only=True)
+            mentors = await self.db.get_mentors(active_only=True)
             matching_mentor = next((m for m in mentors if m.get("name", "").lower() == mentor_name.lower()), None)
             if matching_mentor:
                 mentor_id = matching_mentor.get("id")
@@ -338,41 +353,39 @@ class VoiceAgent(Agent):
         if not mentor_id:
             return "Please select a mentor first using list_mentors tool."
         
-        # Check if mentor has availability set
-        mentor = self.db.get_mentor_by_id(mentor_id)
-        if not mentor:
-            return "Invalid mentor. Please use list_mentors to see available mentors."
-        
         # Check mentor availability for the date range
         slots = []
         try:
             start_date = datetime.strptime(date, "%Y-%m-%d").date() if date else datetime.now().date() + timedelta(days=1)
         except ValueError:
             start_date = datetime.now().date() + timedelta(days=1)
+        first, last = start_date.isoformat(), (start_date + _SLOT_WINDOW[-1]).isoformat()
+        
+        # Mentor, availability and bookings for the whole window in three
+        # concurrent queries, instead of two per day
+        mentor, availability, booked = await asyncio.gather(
+            self.db.get_mentor_by_id(mentor_id),
+            self.db.get_mentor_availability(mentor_id, start_date=first, end_date=last),
+            self.db.get_booked_slots(mentor_id, first, last),
+        )
+        if not mentor:
+            return "Invalid mentor. Please use list_mentors to see available mentors."
+        
+        avail_by_date = {}
+        for avail in availability:
+            avail_by_date.setdefault(avail["date"], []).append(avail)
         
-        for day_offset in range(5):
-            slot_date = start_date + timedelta(days=day_offset)
+        for offset in _SLOT_WINDOW:
+            slot_date = start_date + offset
             if slot_date.weekday() >= 5:
                 continue
-            date_str = slot_date.strftime("%Y-%m-%d")
+            date_str = slot_date.isoformat()
             day_name = slot_date.strftime("%A")
             
-            # Check mentor availability for this date
-            availability = self.db.get_mentor_availability(mentor_id, start_date=date_str, end_date=date_str)
-            if not availability:
-                continue  # Mentor not available on this date
-            
-            # Get available slots from mentor_availability
-            for avail in availability:
-                start_time = datetime.strptime(avail["start_time"], "%H:%M:%S").time()
-                end_time = datetime.strptime(avail["end_time"], "%H:%M:%S").time()
-                slot_duration = avail.get("slot_duration_minutes", 60)
-                
-                current_time = start_time
-                while current_time < end_time:
-                    time_str = current_time.strftime("%H:%M")
-                    # Check if slot is not booked (is_mentor_available already checked via get_mentor_availability)
-                    if not self.db.is_slot_booked(date_str, time_str, mentor_id):
+            # Get available slots from mentor_availability (absent dates have none)
+            for avail in avail_by_date.get(date_str, ()):
+                for time_str in slot_times(avail["start_time"], avail["end_time"], avail.get("slot_duration_minutes", 60)):
+                    if (date_str, time_str) not in booked:
                         slots.append({
                             "date": date_str,
                             "day": day_name,
@@ -380,12 +393,8 @@ class VoiceAgent(Agent):
                             "display": f"{day_name} {date_str} at {time_str}",
                             "mentor_id": mentor_id
                         })
-                    
-                    # Move to next slot
-                    current_time = (datetime.combine(datetime.today(), current_time) + 
-                                   timedelta(minutes=slot_duration)).time()
         
-        self.db.add_message(self.session_id, "tool", f"Fetched {len(slots)} slots for mentor", 
+        await self.db.add_message(self.session_id, "tool", f"Fetched {len(slots)} slots for mentor", 
                            tool_name="fetch_slots", tool_args={"mentor_id": mentor_id, "date": date}, 
                            tool_result={"slots_count": len(slots)})
         await self.send_to_frontend("tool_call", {"tool": "fetch_slots", "args": {"mentor_id": mentor_id, "date": date}, 
@@ -413,7 +422,7 @@ class VoiceAgent(Agent):
         
         # If mentor_name provided, find the mentor_id
         if mentor_name and not mentor_id:
-            mentors = self.db.get_mentors(active_only=True)
+            mentors = await self.db.get_mentors(active_only=True)
             matching_mentor = next((m for m in mentors if m.get("name", "").lower() == mentor_name.lower()), None)
             if matching_mentor:
                 mentor_id = matching_mentor.get("id")
@@ -433,26 +442,27 @@ class VoiceAgent(Agent):
                                                   "result": {"success": False, "reason": error_msg}})
             return error_msg
         
-        # Verify mentor exists
-        mentor = self.db.get_mentor_by_id(mentor_id)
+        # Mentor and availability checks are independent lookups; run them together
+        mentor, available = await asyncio.gather(
+            self.db.get_mentor_by_id(mentor_id),
+            self.db.is_mentor_available(mentor_id, date, time),
+        )
         if not mentor:
             return "Invalid mentor. Please use list_mentors to see available mentors."
         
         # Check if mentor has availability for this date/time
-        if not self.db.is_mentor_available(mentor_id, date, time):
+        if not available:
             return f"Sorry, {mentor.get('name')} is not available on {date} at {time}. Would you like to see other available slots?"
         
-        # Check if slot is booked
-        if self.db.is_slot_booked(date, time, mentor_id):
+        # Book appointment; no row back means the slot is already taken
+        appointment = await self.db.book_appointment(self.user_phone, date, time, mentor_id=mentor_id, notes=notes, duration_minutes=60)
+        if not appointment:
             await self.send_to_frontend("tool_call", {"tool": "book_appointment", "args": {"date": date, "time": time}, 
                                                   "result": {"success": False, "reason": "Slot already booked"}})
             return f"Sorry, {date} at {time} is already booked with {mentor.get('name')}. Would you like a different time?"
-        
-        # Book appointment
-        appointment = self.db.book_appointment(self.user_phone, date, time, mentor_id=mentor_id, notes=notes, duration_minutes=60)
         appointment_id = appointment.get("id")
         
-        self.db.add_message(
+        await self.db.add_message(
             self.session_id, "tool", f"Booked: {date} {time} with {mentor.get('name')}",
             tool_name="book_appointment",
             tool_args={"date": date, "time": time, "mentor_id": mentor_id, "notes": notes},
@@ -474,9 +484,11 @@ class VoiceAgent(Agent):
         if not self.user_phone:
             return "I need to identify you first. What's your phone number?"
         
-        appointments = self.db.get_user_appointments(self.user_phone, status=["pending", "booked"])
-        self.db.add_message(self.session_id, "tool", f"Retrieved {len(appointments)} appointments", tool_name="retrieve_appointments", tool_args={}, tool_result={"count": len(appointments), "appointments": appointments})
-        await self.send_to_frontend("tool_call", {"tool": "retrieve_appointments", "args": {}, "result": {"appointments": appointments}})
+        appointments = await self.db.get_user_appointments(self.user_phone, status=ACTIVE_STATUSES, cached=True)
+        await asyncio.gather(
+            self.db.add_message(self.session_id, "tool", f"Retrieved {len(appointments)} appointments", tool_name="retrieve_appointments", tool_args={}, tool_result={"count": len(appointments), "appointments": appointments}),
+            self.send_to_frontend("tool_call", {"tool": "retrieve_appointments", "args": {}, "result": {"appointments": appointments}}),
+        )
         
         if not appointments:
             return "You don't have any upcoming appointments. Would you like to book one?"
@@ -511,7 +523,7 @@ class VoiceAgent(Agent):
         
         # If appointment_id provided, use it for more precise cancellation
         if appointment_id:
-            appointment = self.db.get_appointment_by_id(appointment_id)
+            appointment = await self.db.get_appointment_by_id(appointment_id)
             if not appointment:
                 return f"Appointment with ID {appointment_id} not found. Would you like to see your appointments?"
             
@@ -520,12 +532,12 @@ class VoiceAgent(Agent):
                 return "This appointment doesn't belong to you. Would you like to see your appointments?"
             
             # Cancel by ID
-            success = self.db.cancel_appointment_by_id(appointment_id)
+            success = await self.db.cancel_appointment_by_id(appointment_id)
             mentor_name = "a consultant"
             if isinstance(appointment.get("mentors"), dict):
                 mentor_name = appointment.get("mentors", {}).get("name", "a consultant")
             
-            self.db.add_message(self.session_id, "tool", f"Cancel: {appointment_id}", 
+            await self.db.add_message(self.session_id, "tool", f"Cancel: {appointment_id}", 
                               tool_name="cancel_appointment", 
                               tool_args={"appointment_id": appointment_id, "date": date, "time": time}, 
                               tool_result={"success": success, "appointment_id": appointment_id, "mentor_name": mentor_name})
@@ -537,7 +549,7 @@ class VoiceAgent(Agent):
         
         # Fallback to date/time matching
         # First, find the appointment to get details
-        appointments = self.db.get_user_appointments(self.user_phone, status=["pending", "booked"])
+        appointments = await self.db.get_user_appointments(self.user_phone, status=ACTIVE_STATUSES, cached=True)
         matching_apt = None
         for apt in appointments:
             if apt.get("date") == date and apt.get("time") == time:
@@ -548,12 +560,12 @@ class VoiceAgent(Agent):
             return f"I couldn't find an active appointment on {date} at {time}. Would you like to see your appointments?"
         
         # Cancel by date/time
-        success = self.db.cancel_appointment(self.user_phone, date, time)
+        success = await self.db.cancel_appointment(self.user_phone, date, time)
         mentor_name = "a consultant"
         if isinstance(matching_apt.get("mentors"), dict):
             mentor_name = matching_apt.get("mentors", {}).get("name", "a consultant")
         
-        self.db.add_message(self.session_id, "tool", f"Cancel: {date} {time}", 
+        await self.db.add_message(self.session_id, "tool", f"Cancel: {date} {time}", 
                           tool_name="cancel_appointment", 
                           tool_args={"date": date, "time": time}, 
                           tool_result={"success": success, "appointment_id": matching_apt.get("id"), "mentor_name": mentor_name})
@@ -590,14 +602,14 @@ class VoiceAgent(Agent):
         # Find the original appointment to get mentor_id
         original_appointment = None
         if appointment_id:
-            original_appointment = self.db.get_appointment_by_id(appointment_id)
+            original_appointment = await self.db.get_appointment_by_id(appointment_id)
             if not original_appointment:
                 return f"Appointment with ID {appointment_id} not found. Would you like to see your appointments?"
             if original_appointment.get("contact_number") != self.user_phone:
                 return "This appointment doesn't belong to you. Would you like to see your appointments?"
         else:
             # Find by date/time
-            appointments = self.db.get_user_appointments(self.user_phone, status=["pending", "booked"])
+            appointments = await self.db.get_user_appointments(self.user_phone, status=ACTIVE_STATUSES, cached=True)
             for apt in appointments:
                 if apt.get("date") == old_date and apt.get("time") == old_time:
                     original_appointment = apt
@@ -610,26 +622,30 @@ class VoiceAgent(Agent):
         if not mentor_id:
             return f"Your appointment on {old_date} at {old_time} doesn't have a mentor assigned. Please contact support."
         
-        # Verify mentor still exists
-        mentor = self.db.get_mentor_by_id(mentor_id)
+        # Verify mentor still exists, has the new slot open, and it isn't taken
+        mentor, available, taken = await asyncio.gather(
+            self.db.get_mentor_by_id(mentor_id),
+            self.db.is_mentor_available(mentor_id, new_date, new_time),
+            self.db.is_slot_booked(new_date, new_time, mentor_id),
+        )
         if not mentor:
             return f"The mentor for your appointment is no longer available. Please book a new appointment."
         
         # Check if new slot has mentor availability
-        if not self.db.is_mentor_available(mentor_id, new_date, new_time):
+        if not available:
             await self.send_to_frontend("tool_call", {"tool": "modify_appointment", "args": {"old_date": old_date, "new_date": new_date}, "result": {"success": False, "reason": "Mentor not available"}})
             return f"Sorry, {mentor.get('name')} is not available on {new_date} at {new_time}. Would you like to pick another time?"
         
         # Check if new slot is booked for this mentor
-        if self.db.is_slot_booked(new_date, new_time, mentor_id):
+        if taken:
             await self.send_to_frontend("tool_call", {"tool": "modify_appointment", "args": {"old_date": old_date, "new_date": new_date}, "result": {"success": False, "reason": "Slot already booked"}})
             return f"Sorry, {new_date} at {new_time} is already booked with {mentor.get('name')}. Would you like to pick another time?"
         
         # Modify appointment (preserving mentor_id)
-        result = self.db.modify_appointment(self.user_phone, old_date, old_time, new_date, new_time, mentor_id=mentor_id)
+        result = await self.db.modify_appointment(self.user_phone, old_date, old_time, new_date, new_time, mentor_id=mentor_id)
         
         appointment_id = original_appointment.get("id")
-        self.db.add_message(self.session_id, "tool", f"Modify: {old_date} {old_time} → {new_date} {new_time}", 
+        await self.db.add_message(self.session_id, "tool", f"Modify: {old_date} {old_time} → {new_date} {new_time}", 
                           tool_name="modify_appointment", 
                           tool_args={"old_date": old_date, "old_time": old_time, "new_date": new_date, "new_time": new_time, "appointment_id": appointment_id}, 
                           tool_result={"success": bool(result), "appointment_id": appointment_id, "mentor_name": mentor.get("name")})
@@ -642,8 +658,13 @@ class VoiceAgent(Agent):
     @function_tool()
     async def end_conversation(self, context: RunContext) -> str:
         """End the conversation and generate summary. Cost breakdown is only for admin, not shown to user."""
-        messages = self.db.get_session_messages(self.session_id)
-        appointments = self.db.get_user_appointments(self.user_phone, status="booked") if self.user_phone else []
+        if self.user_phone:
+            messages, appointments = await asyncio.gather(
+                self.db.get_session_messages(self.session_id),
+                self.db.get_user_appointments(self.user_phone, status="booked", cached=True),
+            )
+        else:
+            messages, appointments = await self.db.get_session_messages(self.session_id), []
         
         actions_taken = [m for m in messages if m.get("role") == "tool" and m.get("tool_name")]
         summary_parts = []
@@ -678,7 +699,7 @@ class VoiceAgent(Agent):
         admin_summary = {**user_summary, "cost_breakdown": cost}
         
         # Save session with cost (for admin)
-        self.db.end_session(self.session_id, contact_number=self.user_phone, summary=summary_text, cost_breakdown=cost)
+        await self.db.end_session(self.session_id, contact_number=self.user_phone, summary=summary_text, cost_breakdown=cost)
         
         # Send user-facing summary (no cost)
         await self.send_to_frontend("summary", user_summary)
@@ -694,35 +715,44 @@ class VoiceAgent(Agent):
         return response
 
 
+def prewarm(proc: JobProcess):
+    """Load the VAD model and the Supabase SDK once per worker process,
+    before it accepts jobs, so neither cost lands on a caller's first turn."""
+    proc.userdata["vad"] = silero.VAD.load()
+    if settings.SUPABASE_URL:
+        import supabase  # noqa: F401
+
+
 async def entrypoint(ctx: JobContext):
     """LiveKit Agent entrypoint with Beyond Presence avatar."""
     await ctx.connect(auto_subscribe=AutoSubscribe.SUBSCRIBE_ALL)
     
     logger.info(f"Connected to room: {ctx.room.name}")
     
-    db = Database()
+    db = Database.get()
+    await db.connect()
     
     # Cleanup abandoned sessions periodically (every session start)
     try:
-        cleaned = db.cleanup_abandoned_sessions(timeout_minutes=30)
+        cleaned = await db.cleanup_abandoned_sessions(timeout_minutes=30)
         if cleaned > 0:
             logger.info(f"Cleaned up {cleaned} abandoned sessions")
     except Exception as e:
         logger.debug(f"Session cleanup error (non-critical): {e}")
     
-    session_record = db.create_session(room_name=ctx.room.name)
+    session_record = await db.create_session(room_name=ctx.room.name)
     session_id = session_record["id"]
     
     logger.info(f"Session created: {session_id} for room: {ctx.room.name}")
     
     # Create AgentSession with STT, LLM, TTS (but don't start it yet)
     session = AgentSession(
-        vad=silero.VAD.load(),
+        vad=ctx.proc.userdata["vad"],
         stt=deepgram.STT(model="nova-2", language="en-US"),
-        llm=openai.LLM(model=os.getenv("OPENAI_MODEL", "gpt-4o-mini")),
+        llm=openai.LLM(model=settings.OPENAI_MODEL),
         tts=cartesia.TTS(
             model="sonic-2",
-            voice=os.getenv("CARTESIA_VOICE_ID", "a0e99841-438c-4a64-b679-ae501e7d6091"),
+            voice=settings.CARTESIA_VOICE_ID,
             language="en",
         ),
         allow_interruptions=True,
@@ -751,15 +781,15 @@ async def entrypoint(ctx: JobContext):
     def on_user_speech(ev):
         text = getattr(ev, 'text', '') or getattr(ev, 'transcript', '')
         if text:
-            db.add_message(session_id, "user", text)
-            loop.create_task(agent.send_to_frontend("transcript", {"role": "user", "text": text}))
+            _spawn(loop, db.add_message(session_id, "user", text))
+            _spawn(loop, agent.send_to_frontend("transcript", {"role": "user", "text": text}))
     
     @session.on("agent_speech_committed")
     def on_agent_speech(ev):
         text = getattr(ev, 'text', '') or getattr(ev, 'transcript', '')
         if text:
-            db.add_message(session_id, "assistant", text)
-            loop.create_task(agent.send_to_frontend("transcript", {"role": "assistant", "text": text}))
+            _spawn(loop, db.add_message(session_id, "assistant", text))
+            _spawn(loop, agent.send_to_frontend("transcript", {"role": "assistant", "text": text}))
     
     # Create Beyond Presence avatar session
     avatar = bey.AvatarSession(
@@ -795,4 +825,4 @@ async def entrypoint(ctx: JobContext):
 
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
+    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm))
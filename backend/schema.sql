@@ -23,6 +23,7 @@ CREATE TABLE IF NOT EXISTS users (
 
 CREATE INDEX IF NOT EXISTS idx_users_phone ON users(contact_number);
 CREATE INDEX IF NOT EXISTS idx_users_active ON users(is_active);
+CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at DESC, id DESC);
 
 -- ==================== MENTORS ====================
 CREATE TABLE IF NOT EXISTS mentors (
@@ -69,6 +70,9 @@ CREATE TABLE IF NOT EXISTS mentor_availability (
 
 CREATE INDEX IF NOT EXISTS idx_availability_mentor ON mentor_availability(mentor_id, date);
 CREATE INDEX IF NOT EXISTS idx_availability_date ON mentor_availability(date, is_available);
+-- Bookable windows only (is_mentor_available, slot listing)
+CREATE INDEX IF NOT EXISTS idx_availability_open ON mentor_availability(mentor_id, date, start_time)
+    WHERE is_available;
 
 -- ==================== APPOINTMENTS ====================
 CREATE TABLE IF NOT EXISTS appointments (
@@ -92,6 +96,32 @@ CREATE INDEX IF NOT EXISTS idx_appointments_user ON appointments(contact_number,
 CREATE INDEX IF NOT EXISTS idx_appointments_mentor ON appointments(mentor_id, date, status);
 CREATE INDEX IF NOT EXISTS idx_appointments_slot ON appointments(date, time, status);
 CREATE INDEX IF NOT EXISTS idx_appointments_status ON appointments(status);
+-- A mentor's slot can be held by one active appointment at a time. Also serves
+-- the slot-taken checks (is_slot_booked, get_booked_times), which only look at
+-- slot-holding rows, and book_appointment's ON CONFLICT.
+-- Databases that booked with check-then-insert may already hold two active
+-- appointments for one slot: the earliest is kept and the rest are cancelled
+-- (and reported) first, so the index builds. The old non-unique index is
+-- only dropped once the unique one exists
+DO $$
+DECLARE
+    n INT;
+BEGIN
+    UPDATE appointments a SET status = 'cancelled'
+    FROM (
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY mentor_id, date, time ORDER BY created_at, id) AS rn
+        FROM appointments
+        WHERE mentor_id IS NOT NULL AND status IN ('pending', 'booked')
+    ) dup
+    WHERE a.id = dup.id AND dup.rn > 1;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    IF n > 0 THEN
+        RAISE NOTICE 'Cancelled % duplicate active appointment(s) before creating uq_appointments_active_slot', n;
+    END IF;
+END $$;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_appointments_active_slot ON appointments(mentor_id, date, time)
+    WHERE status IN ('pending', 'booked');
+DROP INDEX IF EXISTS idx_appointments_active_slot;
 
 -- ==================== SESSIONS (Voice Conversations) ====================
 CREATE TABLE IF NOT EXISTS sessions (
@@ -108,10 +138,22 @@ CREATE TABLE IF NOT EXISTS sessions (
     metadata JSONB DEFAULT '{}'
 );
 
+-- Session total as a real column, computed once on write instead of
+-- extracted from the JSON on every read
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS cost NUMERIC
+    GENERATED ALWAYS AS (COALESCE((cost_breakdown->>'total')::NUMERIC, 0)) STORED;
+
 CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(contact_number);
 CREATE INDEX IF NOT EXISTS idx_sessions_ended ON sessions(contact_number, ended_at DESC);
 CREATE INDEX IF NOT EXISTS idx_sessions_room ON sessions(room_name);
 CREATE INDEX IF NOT EXISTS idx_sessions_status ON sessions(status);
+-- Live sessions are a small slice of the table; cleanup_abandoned_sessions
+-- range-scans this by age
+CREATE INDEX IF NOT EXISTS idx_sessions_active_started ON sessions(started_at)
+    WHERE status = 'active';
+-- Keyset order for the session lists (list_all_sessions, get_session_costs)
+DROP INDEX IF EXISTS idx_sessions_started_costs;
+CREATE INDEX IF NOT EXISTS idx_sessions_started ON sessions(started_at DESC, id DESC);
 
 -- ==================== SESSION MESSAGES ====================
 CREATE TABLE IF NOT EXISTS session_messages (
@@ -159,6 +201,26 @@ CREATE TABLE IF NOT EXISTS cost_logs (
 CREATE INDEX IF NOT EXISTS idx_cost_logs_session ON cost_logs(session_id);
 CREATE INDEX IF NOT EXISTS idx_cost_logs_service ON cost_logs(service, created_at);
 
+-- Pre-aggregated cost rollups for the admin cost report. Unique indexes allow
+-- REFRESH ... CONCURRENTLY, so reads never block on a refresh.
+CREATE MATERIALIZED VIEW IF NOT EXISTS cost_summary_day AS
+    SELECT date_trunc('day', created_at) AS bucket, service,
+           SUM(cost_usd) AS total, SUM(units) AS units, COUNT(*) AS calls
+    FROM cost_logs GROUP BY 1, 2;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_cost_summary_day ON cost_summary_day(bucket, service);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS cost_summary_week AS
+    SELECT date_trunc('week', created_at) AS bucket, service,
+           SUM(cost_usd) AS total, SUM(units) AS units, COUNT(*) AS calls
+    FROM cost_logs GROUP BY 1, 2;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_cost_summary_week ON cost_summary_week(bucket, service);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS cost_summary_month AS
+    SELECT date_trunc('month', created_at) AS bucket, service,
+           SUM(cost_usd) AS total, SUM(units) AS units, COUNT(*) AS calls
+    FROM cost_logs GROUP BY 1, 2;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_cost_summary_month ON cost_summary_month(bucket, service);
+
 -- ==================== ROW LEVEL SECURITY ====================
 ALTER TABLE users ENABLE ROW LEVEL SECURITY;
 ALTER TABLE mentors ENABLE ROW LEVEL SECURITY;
@@ -191,6 +253,30 @@ BEGIN
     CREATE POLICY "Allow all cost_logs" ON cost_logs FOR ALL USING (true);
 END $$;
 
+-- ==================== TRIGGERS ====================
+
+-- Stamp updated_at in the database on every UPDATE (including upsert
+-- conflicts), so writers don't compute and send it
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_updated_at ON users;
+CREATE TRIGGER users_updated_at BEFORE UPDATE ON users
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS mentors_updated_at ON mentors;
+CREATE TRIGGER mentors_updated_at BEFORE UPDATE ON mentors
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS appointments_updated_at ON appointments;
+CREATE TRIGGER appointments_updated_at BEFORE UPDATE ON appointments
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
 -- ==================== VIEWS ====================
 
 -- View for appointment calendar (mentor dashboard)
@@ -213,6 +299,20 @@ LEFT JOIN mentors m ON a.mentor_id = m.id
 WHERE a.status IN ('pending', 'booked', 'completed')
 ORDER BY a.date, a.time;
 
+-- Appointments with the booking user and mentor folded in. The users/mentors
+-- columns carry the same nested shape a PostgREST users(...)/mentors(...) embed
+-- returns, so the API reads one flat relation instead of resolving embeds
+CREATE OR REPLACE VIEW appointments_full WITH (security_invoker = true) AS
+SELECT
+    a.*,
+    CASE WHEN u.id IS NULL THEN NULL
+         ELSE json_build_object('name', u.name, 'contact_number', u.contact_number) END AS users,
+    CASE WHEN m.id IS NULL THEN NULL
+         ELSE json_build_object('name', m.name, 'specialty', m.specialty) END AS mentors
+FROM appointments a
+LEFT JOIN users u ON a.user_id = u.id
+LEFT JOIN mentors m ON a.mentor_id = m.id;
+
 -- View for admin cost summary
 CREATE OR REPLACE VIEW cost_summary AS
 SELECT 
@@ -237,42 +337,33 @@ RETURNS TABLE (
     slot_time TIME,
     is_booked BOOLEAN
 ) AS $$
-DECLARE
-    v_start_time TIME;
-    v_end_time TIME;
-    v_slot_duration INT;
-    v_current_time TIME;
-BEGIN
-    -- Get availability for the date
-    SELECT start_time, end_time, slot_duration_minutes
-    INTO v_start_time, v_end_time, v_slot_duration
-    FROM mentor_availability
-    WHERE mentor_id = p_mentor_id 
-      AND date = p_date 
-      AND is_available = TRUE
-    LIMIT 1;
-    
-    IF v_start_time IS NULL THEN
-        RETURN;
-    END IF;
-    
-    v_current_time := v_start_time;
-    
-    WHILE v_current_time < v_end_time LOOP
-        RETURN QUERY
-        SELECT 
-            v_current_time,
-            EXISTS (
-                SELECT 1 FROM appointments 
-                WHERE mentor_id = p_mentor_id 
-                  AND date = p_date 
-                  AND time = v_current_time 
-                  AND status IN ('pending', 'booked')
-            );
-        v_current_time := v_current_time + (v_slot_duration || ' minutes')::INTERVAL;
-    END LOOP;
-END;
-$$ LANGUAGE plpgsql;
+    -- One set-based pass: generate_series lays out the slot grid for the
+    -- day's availability window and each slot probes the active-slot index
+    SELECT
+        s::TIME,
+        EXISTS (
+            SELECT 1 FROM appointments a
+            WHERE a.mentor_id = p_mentor_id
+              AND a.date = p_date
+              AND a.time = s::TIME
+              AND a.status IN ('pending', 'booked')
+        )
+    FROM (
+        SELECT start_time, end_time, slot_duration_minutes
+        FROM mentor_availability
+        WHERE mentor_id = p_mentor_id
+          AND date = p_date
+          AND is_available = TRUE
+        ORDER BY start_time
+        LIMIT 1
+    ) ma,
+    LATERAL generate_series(
+        p_date + ma.start_time,
+        p_date + ma.end_time - INTERVAL '1 second',
+        make_interval(mins => COALESCE(NULLIF(ma.slot_duration_minutes, 0), 60))
+    ) AS s
+    ORDER BY 1;
+$$ LANGUAGE sql STABLE;
 
 -- Function to check if appointment time has passed (for status update)
 CREATE OR REPLACE FUNCTION check_completed_appointments()
@@ -298,15 +389,225 @@ RETURNS TABLE (
     total_cost DECIMAL
 ) AS $$
 BEGIN
+    -- One aggregate pass per table: FILTER clauses replace the separate
+    -- per-status subqueries over sessions and appointments
+    RETURN QUERY
+    WITH u AS (
+        SELECT COUNT(*) AS active FROM users WHERE is_active = TRUE
+    ), m AS (
+        SELECT COUNT(*) AS active FROM mentors WHERE is_active = TRUE
+    ), s AS (
+        SELECT COUNT(*) AS total,
+               COUNT(*) FILTER (WHERE status = 'active') AS active
+        FROM sessions
+    ), a AS (
+        SELECT COUNT(*) AS total,
+               COUNT(*) FILTER (WHERE status = 'pending') AS pending,
+               COUNT(*) FILTER (WHERE status = 'completed') AS completed
+        FROM appointments
+    ), c AS (
+        SELECT COALESCE(SUM(cost_usd), 0) AS total FROM cost_logs
+    )
+    SELECT u.active, m.active, s.total, s.active, a.total, a.pending, a.completed, c.total
+    FROM u, m, s, a, c;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function to close a session: timestamps and duration use the database clock,
+-- and the per-service cost rows are written in the same transaction
+CREATE OR REPLACE FUNCTION end_session(
+    p_id UUID,
+    p_contact_number TEXT DEFAULT NULL,
+    p_summary TEXT DEFAULT NULL,
+    p_cost JSONB DEFAULT NULL
+)
+RETURNS void AS $$
+BEGIN
+    UPDATE sessions
+    SET ended_at = NOW(),
+        status = 'completed',
+        duration_seconds = EXTRACT(EPOCH FROM NOW() - started_at)::INT,
+        contact_number = COALESCE(p_contact_number, contact_number),
+        summary = COALESCE(p_summary, summary),
+        cost_breakdown = COALESCE(p_cost, cost_breakdown)
+    WHERE id = p_id;
+
+    IF p_cost IS NOT NULL THEN
+        INSERT INTO cost_logs (session_id, service, units, unit_type, cost_usd) VALUES
+            (p_id, 'deepgram_stt', COALESCE((p_cost->'breakdown'->>'stt_minutes')::DECIMAL, 0), 'minutes', COALESCE((p_cost->>'stt')::DECIMAL, 0)),
+            (p_id, 'cartesia_tts', COALESCE((p_cost->'breakdown'->>'tts_characters')::DECIMAL, 0), 'characters', COALESCE((p_cost->>'tts')::DECIMAL, 0)),
+            (p_id, 'openai_llm', COALESCE((p_cost->'breakdown'->>'llm_total_tokens')::DECIMAL, 0), 'tokens', COALESCE((p_cost->>'llm')::DECIMAL, 0));
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function to move an active appointment to a new slot. The availability and
+-- conflict checks sit in the same statement as the update; returns the moved
+-- row, or no rows if the slot is unavailable or taken
+CREATE OR REPLACE FUNCTION move_appointment(
+    p_phone TEXT,
+    p_old_date DATE,
+    p_old_time TIME,
+    p_new_date DATE,
+    p_new_time TIME,
+    p_mentor_id UUID DEFAULT NULL
+)
+RETURNS SETOF appointments AS $$
+BEGIN
+    IF p_mentor_id IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM mentor_availability
+        WHERE mentor_id = p_mentor_id
+          AND date = p_new_date
+          AND is_available = TRUE
+          AND start_time <= p_new_time AND p_new_time < end_time
+    ) THEN
+        RETURN;
+    END IF;
+
     RETURN QUERY
-    SELECT 
-        (SELECT COUNT(*) FROM users WHERE is_active = TRUE),
-        (SELECT COUNT(*) FROM mentors WHERE is_active = TRUE),
-        (SELECT COUNT(*) FROM sessions),
-        (SELECT COUNT(*) FROM sessions WHERE status = 'active'),
-        (SELECT COUNT(*) FROM appointments),
-        (SELECT COUNT(*) FROM appointments WHERE status = 'pending'),
-        (SELECT COUNT(*) FROM appointments WHERE status = 'completed'),
-        (SELECT COALESCE(SUM(cost_usd), 0) FROM cost_logs);
+    UPDATE appointments a
+    SET date = p_new_date,
+        time = p_new_time,
+        mentor_id = COALESCE(p_mentor_id, a.mentor_id),
+        updated_at = NOW()
+    WHERE a.contact_number = p_phone
+      AND a.date = p_old_date
+      AND a.time = p_old_time
+      AND a.status IN ('pending', 'booked')
+      AND NOT EXISTS (
+          SELECT 1 FROM appointments b
+          WHERE b.date = p_new_date
+            AND b.time = p_new_time
+            AND b.status IN ('pending', 'booked')
+            AND b.id <> a.id
+            AND (p_mentor_id IS NULL OR b.mentor_id = p_mentor_id)
+      )
+    RETURNING a.*;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function to refresh the cost rollups, scheduled below
+CREATE OR REPLACE FUNCTION refresh_cost_summaries()
+RETURNS void AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY cost_summary_day;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY cost_summary_week;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY cost_summary_month;
 END;
 $$ LANGUAGE plpgsql;
+
+-- Refresh the rollups every 15 minutes with pg_cron (cron.schedule replaces
+-- a job of the same name, so re-running this is safe). Where pg_cron can't
+-- be enabled the script carries on, and the cost report only changes when
+-- refresh_cost_summaries() is run by hand
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        BEGIN
+            CREATE EXTENSION pg_cron;
+        EXCEPTION WHEN OTHERS THEN
+            RAISE NOTICE 'pg_cron unavailable (%): cost_summary_* will not refresh on their own', SQLERRM;
+            RETURN;
+        END;
+    END IF;
+    PERFORM cron.schedule('refresh-cost-summaries', '*/15 * * * *', 'SELECT refresh_cost_summaries()');
+END $$;
+
+-- Function to load the admin dashboard in one round trip: stats, the daily
+-- cost rollup for a date range and the latest sessions with their costs
+CREATE OR REPLACE FUNCTION get_admin_dashboard(
+    p_start DATE DEFAULT NULL,
+    p_end DATE DEFAULT NULL,
+    p_limit INT DEFAULT 50
+)
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'stats', (SELECT row_to_json(st) FROM get_admin_stats() st),
+        'costs', COALESCE((
+            SELECT json_agg(c ORDER BY c.bucket)
+            FROM cost_summary_day c
+            WHERE (p_start IS NULL OR c.bucket >= p_start)
+              AND (p_end IS NULL OR c.bucket <= p_end)
+        ), '[]'::json),
+        'sessions', COALESCE((
+            SELECT json_agg(t)
+            FROM (
+                SELECT s.id, s.contact_number, s.started_at, s.cost_breakdown, s.cost,
+                       CASE WHEN u.id IS NULL THEN NULL ELSE json_build_object('name', u.name) END AS users
+                FROM sessions s
+                LEFT JOIN users u ON u.id = s.user_id
+                ORDER BY s.started_at DESC, s.id DESC
+                LIMIT p_limit
+            ) t
+        ), '[]'::json)
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Function to book an appointment, creating the user row for a new phone
+-- number in the same statement. The users lookup can't see the CTE's insert,
+-- so the new id and the existing id are unioned. Returns no rows if the
+-- mentor's slot is already held (uq_appointments_active_slot) or no mentor is
+-- given, since NULL mentor_ids never conflict in that index
+CREATE OR REPLACE FUNCTION book_appointment(
+    p_phone TEXT,
+    p_date DATE,
+    p_time TIME,
+    p_mentor_id UUID DEFAULT NULL,
+    p_notes TEXT DEFAULT NULL,
+    p_duration INT DEFAULT 60
+)
+RETURNS SETOF appointments AS $$
+    WITH new_user AS (
+        INSERT INTO users (contact_number, name, is_active)
+        VALUES (p_phone, 'User', TRUE)
+        ON CONFLICT (contact_number) DO NOTHING
+        RETURNING id
+    ), u AS (
+        SELECT id FROM new_user
+        UNION ALL
+        SELECT id FROM users WHERE contact_number = p_phone
+        LIMIT 1
+    )
+    INSERT INTO appointments (user_id, contact_number, date, time, duration_minutes, status, mentor_id, notes)
+    SELECT u.id, p_phone, p_date, p_time, p_duration, 'booked', p_mentor_id, p_notes
+    FROM u
+    WHERE p_mentor_id IS NOT NULL
+    ON CONFLICT (mentor_id, date, time) WHERE status IN ('pending', 'booked') DO NOTHING
+    RETURNING *;
+$$ LANGUAGE sql;
+
+-- Function to fetch a user by phone, inserting them first if the number is
+-- new. DO NOTHING leaves an existing row (and its name) untouched, so a
+-- returning caller costs no write
+CREATE OR REPLACE FUNCTION get_or_create_user(
+    p_phone TEXT,
+    p_name TEXT DEFAULT 'User'
+)
+RETURNS SETOF users AS $$
+    WITH new_user AS (
+        INSERT INTO users (contact_number, name, is_active)
+        VALUES (p_phone, p_name, TRUE)
+        ON CONFLICT (contact_number) DO NOTHING
+        RETURNING *
+    )
+    SELECT * FROM new_user
+    UNION ALL
+    SELECT * FROM users WHERE contact_number = p_phone
+    LIMIT 1;
+$$ LANGUAGE sql;
+
+-- Function to mark sessions abandoned once they've been active longer than
+-- the timeout. The cutoff comes from the database clock; returns the count
+CREATE OR REPLACE FUNCTION abandon_stale_sessions(
+    p_timeout_minutes INT DEFAULT 30
+)
+RETURNS INT AS $$
+    WITH abandoned AS (
+        UPDATE sessions
+        SET status = 'abandoned'
+        WHERE status = 'active'
+          AND started_at < NOW() - make_interval(mins => p_timeout_minutes)
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INT FROM abandoned;
+$$ LANGUAGE sql;
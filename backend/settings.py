@@ -0,0 +1,57 @@
+"""
+Environment settings for Voice Agent.
+Loads .env once at import and exposes each value as a module constant.
+"""
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Project root .env first, then backend/.env, then a search from the working
+# directory. load_dotenv returns False for missing/empty files, so the first
+# file that provides values wins. Never overrides variables already set.
+# Railway injects the full environment, so deployed processes skip the
+# filesystem lookups entirely.
+_backend_dir = Path(__file__).parent
+if not os.getenv("RAILWAY_ENVIRONMENT"):
+    load_dotenv(_backend_dir.parent / ".env") or load_dotenv(_backend_dir / ".env") or load_dotenv()
+
+ENVIRONMENT = os.getenv("ENVIRONMENT", "")
+RAILWAY_ENVIRONMENT = os.getenv("RAILWAY_ENVIRONMENT", "")
+
+# Database
+SUPABASE_URL = os.getenv("SUPABASE_URL", "").strip()
+SUPABASE_KEY = os.getenv("SUPABASE_KEY", "").strip()
+# Shared HTTP pool to PostgREST. Size it at ~2x the expected concurrent
+# requests per process; idle connections are kept warm for the expiry window.
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "50"))
+SUPABASE_POOL_KEEPALIVE = int(os.getenv("SUPABASE_POOL_KEEPALIVE", "20"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "30"))
+# Skip the probe query made when the shared client is created (saves a round
+# trip at startup when the deployment is known to be reachable)
+SUPABASE_SKIP_PING = os.getenv("SUPABASE_SKIP_PING", "").lower() in ("1", "true")
+
+# API
+JWT_SECRET = os.getenv("JWT_SECRET", "")
+ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000")
+# bcrypt work factor for new password hashes. Each +1 doubles the cost:
+# ~100ms at 10, ~250ms at 12 on typical hardware. Existing hashes keep the
+# cost they were created with.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Server
+PORT = int(os.getenv("PORT", "8000"))
+HOST = os.getenv("HOST", "0.0.0.0")
+WEB_CONCURRENCY = os.getenv("WEB_CONCURRENCY")
+ACCESS_LOG = os.getenv("ACCESS_LOG", "").lower() in ("1", "true")
+
+# LiveKit
+LIVEKIT_URL = os.getenv("LIVEKIT_URL")
+LIVEKIT_API_KEY = os.getenv("LIVEKIT_API_KEY")
+LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET")
+
+# Agent
+BEY_AVATAR_ID = os.getenv("BEY_AVATAR_ID", "1c7a7291-ee28-4800-8f34-acfbfc2d07c0")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+CARTESIA_VOICE_ID = os.getenv("CARTESIA_VOICE_ID", "a0e99841-438c-4a64-b679-ae501e7d6091")